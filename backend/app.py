@@ -1,9 +1,8 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
 from datetime import datetime
 import os
-import joblib
+import sys
 import numpy as np
 
 app = FastAPI()
@@ -11,21 +10,23 @@ app = FastAPI()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_FILE = os.path.join(BASE_DIR, 'permission_events.csv')
 
-# === ML Model additions ===
-MODEL_PATH = os.path.join(BASE_DIR, 'isolation_forest_dns_public.pkl')
-DNS_FEATURES = ['Entropy', 'DomainLength', 'StrangeCharacters', 'SpecialCharRatio']
-model = joblib.load(MODEL_PATH)
+# Started from backend/ (uvicorn app:app); detection/ and profiler.py are at the repo root
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+from detection.dns import (DNS_FEATURES, check_reference_domains, detect_dns_anomalies,
+                           extract_dns_features, normalize_domain)
+from detection.events import EventBatch, dumps
+from snapshot import AppsSnapshot, not_modified
+from profiler import add_profiler
+
+# Raw domains are only scored if our feature extractor reproduces the
+# model's verdicts on a few known domains
+DNS_REFERENCE_ERRORS = check_reference_domains()
+if DNS_REFERENCE_ERRORS:
+    print(f"⚠️ DNS features disagree with the model on {DNS_REFERENCE_ERRORS}; raw-domain scoring disabled")
 
 def detect_dns_anomaly(event: dict):
     arr = np.array([[event[f] for f in DNS_FEATURES]])
-    pred = model.predict(arr)[0]
-    score = float(model.decision_function(arr)[0])
-    # Convert numpy.bool_ to regular bool
-    is_anomaly = bool(pred == -1)
-    return {
-        'is_anomaly': is_anomaly,
-        'anomaly_score': score
-    }
+    return detect_dns_anomalies(arr)[0]
 
 
 app.add_middleware(
@@ -34,53 +35,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified"],
 )
 
+# Sampling profiler, off until POST /admin/profile (output in backend/profiles)
+profiler = add_profiler(app, os.path.join(BASE_DIR, 'profiles'), 'dashboard')
+
+apps_snapshot = AppsSnapshot(CSV_FILE)
+
 @app.get("/")
 def root():
     return {"status": "Privacy Firewall API Running", "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
+def json_response(payload):
+    """Encode once with the fast encoder instead of FastAPI's generic jsonable_encoder pass"""
+    return Response(content=dumps(payload), media_type="application/json")
+
 @app.get("/events")
 def get_events(limit: int = 50):
     try:
-        df = pd.read_csv(CSV_FILE)
-        recent = df.tail(limit)
-        return {
+        batch = EventBatch.from_csv(CSV_FILE)
+        recent = batch.records(slice(-limit, None) if limit > 0 else slice(0, 0))
+        return json_response({
             "success": True,
             "count": len(recent),
-            "events": recent.to_dict('records')
-        }
+            "events": recent
+        })
     except Exception as e:
         return {"success": False, "error": str(e), "events": []}
 
 @app.get("/events/dashboard")
 def get_dashboard_events(limit: int = 50):
     try:
-        df = pd.read_csv(CSV_FILE)
-        important = df[df['threat_level'].isin(['CRITICAL', 'HIGH', 'MEDIUM'])]
+        batch = EventBatch.from_csv(CSV_FILE)
+        important = batch.level_mask(['CRITICAL', 'HIGH', 'MEDIUM'])
         noise_apps = ['svchost.exe', 'System', 'Registry', 'dwm.exe', 'RuntimeBroker.exe']
-        clean = important[~important['app_name'].isin(noise_apps)]
-        recent = clean.tail(limit)
-        return {
+        clean = np.flatnonzero(important & ~batch.app_mask(noise_apps))
+        recent = batch.records(clean[-limit:] if limit > 0 else clean[:0])
+        return json_response({
             "success": True,
             "count": len(recent),
-            "total_in_db": len(df),
-            "events": recent.to_dict('records')
-        }
+            "total_in_db": len(batch),
+            "events": recent
+        })
     except Exception as e:
         return {"success": False, "error": str(e), "events": []}
 
 @app.get("/stats")
 def get_stats():
     try:
-        df = pd.read_csv(CSV_FILE)
+        batch = EventBatch.from_csv(CSV_FILE)
+        counts = batch.level_counts()
         return {
             "success": True,
-            "total": len(df),
-            "critical": int(len(df[df['threat_level'] == 'CRITICAL'])),
-            "high": int(len(df[df['threat_level'] == 'HIGH'])),
-            "medium": int(len(df[df['threat_level'] == 'MEDIUM'])),
-            "low": int(len(df[df['threat_level'] == 'LOW']))
+            "total": len(batch),
+            "critical": counts['CRITICAL'],
+            "high": counts['HIGH'],
+            "medium": counts['MEDIUM'],
+            "low": counts['LOW']
         }
     except Exception as e:
         return {"success": False, "error": str(e), "total": 0, "critical": 0, "high": 0, "medium": 0, "low": 0}
@@ -88,47 +100,55 @@ def get_stats():
 @app.get("/threats")
 def get_threats():
     try:
-        df = pd.read_csv(CSV_FILE)
-        threats = df[df['threat_level'].isin(['CRITICAL', 'HIGH'])]
-        return {
+        batch = EventBatch.from_csv(CSV_FILE)
+        threats = batch.records(batch.level_mask(['CRITICAL', 'HIGH']))
+        return json_response({
             "success": True,
             "count": len(threats),
-            "threats": threats.to_dict('records')
-        }
+            "threats": threats
+        })
     except Exception as e:
         return {"success": False, "error": str(e), "threats": []}
 
 @app.get("/apps/simple")
-def get_simple_apps():
-    """Simple grouped view - one app per row"""
+def get_simple_apps(request: Request):
+    """Simple grouped view - one app per row (served from the precomputed snapshot)"""
     try:
-        df = pd.read_csv(CSV_FILE)
-        threats = df[df['threat_level'].isin(['CRITICAL', 'HIGH', 'MEDIUM'])]
-        if len(threats) == 0:
-            return {"success": True, "apps": []}
-        apps = []
-        threat_levels = {'CRITICAL': 3, 'HIGH': 2, 'MEDIUM': 1}
-        for app_name in threats['app_name'].unique():
-            app_events = threats[threats['app_name'] == app_name]
-            permissions = sorted(app_events['permission_type'].unique().tolist())
-            max_threat = max(app_events['threat_level'], key=lambda x: threat_levels.get(x, 0))
-            apps.append({
-                'name': app_name,
-                'permissions': permissions,
-                'threat_level': max_threat
-            })
-        apps.sort(key=lambda x: threat_levels.get(x['threat_level'], 0), reverse=True)
-        return {"success": True, "apps": apps}
+        body, etag, last_modified = apps_snapshot.refresh()
     except Exception as e:
         return {"success": False, "error": str(e), "apps": []}
+    headers = {'ETag': etag, 'Last-Modified': last_modified, 'Cache-Control': 'no-cache'}
+    if not_modified(etag, last_modified,
+                    request.headers.get('if-none-match'), request.headers.get('if-modified-since')):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 # === ML API endpoint for DNS scoring (fix) ===
 @app.post("/api/check_dns")
 async def api_check_dns(request: Request):
     """
-    Accept JSON: {"Entropy": float, "DomainLength": int, "StrangeCharacters": int, "SpecialCharRatio": float}
+    Accept JSON, one of:
+      {"Entropy": float, "DomainLength": int, "StrangeCharacters": int, "SpecialCharRatio": float}
+      {"domain": "example.com"}
+      {"domains": ["example.com", ...]}  -> {"results": [...]} in input order
     """
     event = await request.json()
+    if ('domain' in event or 'domains' in event) and DNS_REFERENCE_ERRORS:
+        raise HTTPException(status_code=503, detail="raw-domain scoring disabled: feature extractor fails the reference domains")
+    if 'domains' in event:
+        domains = event['domains']
+        X = extract_dns_features(domains)
+        results = detect_dns_anomalies(X)
+        for domain, row, result in zip(domains, X, results):
+            result['domain'] = normalize_domain(domain)
+            result['features'] = {f: float(v) for f, v in zip(DNS_FEATURES, row)}
+        return {"count": len(results), "results": results}
+    if 'domain' in event:
+        X = extract_dns_features([event['domain']])
+        result = detect_dns_anomalies(X)[0]
+        result['domain'] = normalize_domain(event['domain'])
+        result['features'] = {f: float(v) for f, v in zip(DNS_FEATURES, X[0])}
+        return result
     result = detect_dns_anomaly(event)
     return result
 
@@ -1,72 +1,182 @@
 # database.py
-import csv
+import argparse
 import psutil
 from datetime import datetime
 import random
+import signal
 import time
 import os
-from main import hybrid_threat_detection
+import sys
+
+# Run as a script from backend/ (or via the root database.py); detection/ and
+# profiler.py are at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from detection import score
+from detection.ensemble import ensemble_from_env
+from detection.eventlog import EventLog
+from detection.model import ROOT_DIR
+from detection.policy import compile_policy, load_overrides
+from detection.events import PermissionEvent
+from sensors import DeviceSensor, sensor_available
+from profiler import SamplingProfiler
 
 # GET ABSOLUTE PATH (same as app.py)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 csv_file = os.path.join(BASE_DIR, 'permission_events.csv')
 
-headers = ['timestamp', 'app_name', 'permission_type', 'threat_level', 'reason', 'layers_triggered', 'hour']
+parser = argparse.ArgumentParser(description="Privacy firewall monitor")
+parser.add_argument('--profile-seconds', type=float, default=None,
+                    help="sample the monitor's stacks for this many seconds (output in backend/profiles)")
+parser.add_argument('--profile-sweeps', type=int, default=None,
+                    help="stop profiling after this many sweeps")
+parser.add_argument('--profile-interval-ms', type=float, default=5.0)
+parser.add_argument('--commit-interval', type=float, default=0.0,
+                    help="seconds between CSV group commits (0 = after every sweep)")
+parser.add_argument('--enforce', action='store_true',
+                    help="terminate the process whose device access the policy denies "
+                         "(Linux device sensor only; default: only report)")
+args = parser.parse_args()
 
-# Create CSV with headers if it doesn't exist
-if not os.path.isfile(csv_file):
-    with open(csv_file, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(headers)
+# Buffered CSV writer: creates the file with headers, drops a torn trailing
+# row from a crash, and commits each sweep's rows with one write + fsync
+event_log = EventLog(csv_file, commit_interval=args.commit_interval)
 
 # Apps and permissions to monitor
 apps = ['Zoom', 'Chrome', 'Teams', 'Discord', 'Calculator', 'Notepad', 'cmd']
 permissions = ['camera', 'microphone', 'location', 'storage']
 
-print("🔒 Privacy Firewall Started")
-print(f"📁 Logging to: {csv_file}")  # ADD THIS - shows where CSV is
+# On Linux, sense real camera/microphone use from /proc; elsewhere fall
+# back to sampling the watched apps
+sensor = DeviceSensor() if sensor_available() else None
 
-while True:
+# The fallback sweep guesses permissions, so it must never kill anything
+if args.enforce and sensor is None:
+    parser.error("--enforce needs the Linux device sensor (/proc); the fallback sweep only samples permissions")
+
+def sample_watched_apps():
+    """Fallback sweep: one event per watched process with a sampled permission"""
+    events = []
     for proc in psutil.process_iter(['name']):
         try:
             app_name = proc.info['name']
             if any(app.lower() in app_name.lower() for app in apps):
-                permission = random.choice(permissions)
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                hour = datetime.now().hour
-                
-                threat_level, reason, layers = hybrid_threat_detection(app_name, permission, hour)
-                
-                # Log to CSV
-                with open(csv_file, mode='a', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow([
-                        timestamp,
-                        app_name,
-                        permission,
-                        threat_level,
-                        reason,
-                        ','.join(layers),
-                        hour
-                    ])
-                
-                # Console output
-                if threat_level == "CRITICAL":
-                    print(f"🔴 [CRITICAL] {app_name} → {permission}")
-                    print(f"   {reason}")
-                    print(f"   Detected by: {', '.join(layers)}")
-                elif threat_level == "HIGH":
-                    print(f"🟠 [HIGH] {app_name} → {permission}")
-                    print(f"   {reason}")
-                    print(f"   Detected by: {', '.join(layers)}")
-                elif threat_level == "MEDIUM":
-                    print(f"🟡 [MEDIUM] {app_name} → {permission}")
-                    print(f"   {reason}")
-                    print(f"   Detected by: {', '.join(layers)}")
-                else:
-                    print(f"✅ [NORMAL] {app_name} → {permission}")
-                    
+                now = datetime.now()
+                events.append(PermissionEvent(
+                    now.strftime('%Y-%m-%d %H:%M:%S'),
+                    app_name,
+                    random.choice(permissions),
+                    hour=now.hour
+                ))
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             continue
-    
-    time.sleep(5)
+    return events
+
+print("🔒 Privacy Firewall Started")
+print(f"📁 Logging to: {csv_file}")  # ADD THIS - shows where CSV is
+if sensor:
+    print("📷 Linux device sensor active (/proc/*/fd -> /dev/video*, /dev/snd capture)")
+
+# Optional ensemble layer (PERMISSION_ENSEMBLE="forest=1,frequency=0.5"),
+# seeded with the events already logged
+ensemble = ensemble_from_env(csv_file)
+
+# Decision table compiled in-process (same derivation as main.py's /policy),
+# recompiled every POLICY_REFRESH_SWEEPS so calibrated thresholds carry over
+POLICY_FILE = os.environ.get('PERMISSION_POLICY', os.path.join(ROOT_DIR, 'policy_overrides.json'))
+POLICY_REFRESH_SWEEPS = 60
+
+def load_policy():
+    overrides = load_overrides(POLICY_FILE) if os.path.exists(POLICY_FILE) else {}
+    return compile_policy(overrides, 'enforce' if args.enforce else 'monitor')
+
+def terminate(event):
+    """
+    Stop the process the sensor saw holding the device
+    Returns: True if it was terminated
+    """
+    if event.pid is None:
+        return False
+    try:
+        proc = psutil.Process(event.pid)
+        # The pid may have been reused since the sweep (psutil may extend the
+        # 15-character /proc comm name the sensor logged, hence startswith)
+        if not proc.name().startswith(event.app_name):
+            return False
+        proc.terminate()
+        return True
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+policy = load_policy()
+print(f"🛡️ Policy ({policy.mode}): {policy.counts()}")
+sweeps = 0
+
+profiler = SamplingProfiler(os.path.join(BASE_DIR, 'profiles'), 'monitor')
+if args.profile_seconds or args.profile_sweeps:
+    seconds = args.profile_seconds or 600
+    profiler.start(seconds, args.profile_sweeps, args.profile_interval_ms / 1000)
+    print(f"🔬 Profiling for {seconds:g}s" + (f" or {args.profile_sweeps} sweeps" if args.profile_sweeps else ""))
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+# systemd stops the monitor with SIGTERM; handle it like Ctrl-C so the rows
+# buffered under --commit-interval are committed
+signal.signal(signal.SIGTERM, stop)
+
+try:
+    while True:
+        # Collect this sweep's events, then score them in one batch
+        events = sensor.sweep() if sensor else sample_watched_apps()
+        sweeps += 1
+        if sweeps % POLICY_REFRESH_SWEEPS == 0:
+            policy = load_policy()
+
+        for event, verdict in zip(events, score(events, ensemble=ensemble)):
+            event.apply_verdict(verdict)
+            app_name = event.app_name
+            permission = event.permission_type
+            threat_level = event.threat_level
+            reason = event.reason
+            layers = verdict['layers_triggered']
+
+            # Log to CSV (buffered until the commit below)
+            event_log.append(event)
+
+            # Console output
+            if threat_level == "CRITICAL":
+                print(f"🔴 [CRITICAL] {app_name} → {permission}")
+                print(f"   {reason}")
+                print(f"   Detected by: {', '.join(layers)}")
+            elif threat_level == "HIGH":
+                print(f"🟠 [HIGH] {app_name} → {permission}")
+                print(f"   {reason}")
+                print(f"   Detected by: {', '.join(layers)}")
+            elif threat_level == "MEDIUM":
+                print(f"🟡 [MEDIUM] {app_name} → {permission}")
+                print(f"   {reason}")
+                print(f"   Detected by: {', '.join(layers)}")
+            else:
+                print(f"✅ [NORMAL] {app_name} → {permission}")
+
+            # Policy decision: a table lookup, no scoring or network on this path
+            decision = policy.decide(app_name, permission, event.hour)
+            if decision == 'deny':
+                if args.enforce:
+                    if terminate(event):
+                        print(f"   ⛔ Policy: deny - terminated pid {event.pid}")
+                    else:
+                        print(f"   ⛔ Policy: deny - could not terminate pid {event.pid}")
+                else:
+                    print("   ⛔ Policy: deny (report only, run with --enforce to block)")
+            elif decision == 'ask':
+                print("   ❓ Policy: ask - review this access")
+
+        event_log.maybe_commit()
+        profiler.request_done()
+        time.sleep(5)
+except KeyboardInterrupt:
+    pass
+finally:
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    event_log.close()
@@ -0,0 +1,308 @@
+# dns_tail.py - Passive DNS pipeline: resolver log / pcap -> DNS Isolation Forest -> event CSV
+#
+# Usage:
+#   python dns_tail.py /var/log/dnsmasq.log            # follow a dnsmasq/unbound/BIND query log
+#   python dns_tail.py capture.pcap --pcap             # score a pcap file once
+#
+# Domains are deduplicated within --window seconds, scored in batches through
+# extract_dns_features + detect_dns_anomalies, and anomalies are appended to the
+# same permission_events.csv the dashboard reads.
+
+import argparse
+import os
+import re
+import signal
+import struct
+import sys
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_FILE = os.path.join(BASE_DIR, 'permission_events.csv')
+
+# Run as a script from backend/; detection/ is at the repo root
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+from detection.dns import check_reference_domains, detect_dns_anomalies, extract_dns_features, normalize_domain
+from detection.eventlog import EventLog
+from detection.events import PermissionEvent
+
+# ============================================
+# LOG LINE PARSERS
+# ============================================
+# dnsmasq: "... dnsmasq[123]: query[A] example.com from 192.168.1.5"
+DNSMASQ_RE = re.compile(r'query\[[A-Za-z0-9]+\] (\S+) from (\S+)')
+# unbound (log-queries: yes): "... info: 192.168.1.5 example.com. A IN"
+UNBOUND_RE = re.compile(r'info: (\S+) (\S+)\. [A-Z0-9]+ IN')
+# BIND querylog: "... client @0x7f 192.168.1.5#53012 (example.com): query: example.com IN A +E(0)"
+BIND_RE = re.compile(r'client (?:@\S+ )?([0-9a-fA-F.:]+)#\d+.*?query: (\S+) IN ')
+
+
+def parse_query_line(line):
+    """
+    Parse one resolver log line
+    Returns: (domain, client) or None if the line is not a query
+    """
+    m = DNSMASQ_RE.search(line)
+    if m:
+        return m.group(1), m.group(2)
+    m = BIND_RE.search(line)
+    if m:
+        return m.group(2), m.group(1)
+    m = UNBOUND_RE.search(line)
+    if m:
+        return m.group(2), m.group(1)
+    return None
+
+
+def follow(path, from_start=False, poll=0.2):
+    """
+    Yield lists of new lines appended to path (like tail -F).
+    Reopens the file when it is rotated or truncated.
+    """
+    f = open(path, 'r', errors='replace')
+    if not from_start:
+        f.seek(0, os.SEEK_END)
+    inode = os.fstat(f.fileno()).st_ino
+    partial = ''
+    while True:
+        chunk = f.read(1 << 20)
+        if chunk:
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+            yield lines
+            continue
+        yield []
+        time.sleep(poll)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if st.st_ino != inode or st.st_size < f.tell():
+            f.close()
+            f = open(path, 'r', errors='replace')
+            inode = os.fstat(f.fileno()).st_ino
+            partial = ''
+
+
+# ============================================
+# PCAP READER (classic libpcap format, UDP/53 queries)
+# ============================================
+def _parse_qname(payload, offset):
+    labels = []
+    while offset < len(payload):
+        length = payload[offset]
+        if length == 0:
+            return '.'.join(labels)
+        if length & 0xC0:
+            # Compression pointers do not appear in the question of a query
+            return None
+        offset += 1
+        labels.append(payload[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    return None
+
+
+def _dns_query(frame, linktype):
+    """Returns: (domain, client) for a DNS query frame, else None"""
+    if linktype == 1:           # Ethernet
+        off = 14
+        ethertype = struct.unpack_from('!H', frame, 12)[0]
+        if ethertype == 0x8100:  # 802.1Q
+            ethertype = struct.unpack_from('!H', frame, 16)[0]
+            off = 18
+    elif linktype == 113:       # Linux cooked capture
+        off = 16
+        ethertype = struct.unpack_from('!H', frame, 14)[0]
+    elif linktype == 101:       # Raw IP
+        off = 0
+        ethertype = 0x0800 if frame[0] >> 4 == 4 else 0x86DD
+    else:
+        return None
+
+    if ethertype == 0x0800:
+        ihl = (frame[off] & 0x0F) * 4
+        if frame[off + 9] != 17:
+            return None
+        client = '.'.join(str(b) for b in frame[off + 12:off + 16])
+        off += ihl
+    elif ethertype == 0x86DD:
+        if frame[off + 6] != 17:
+            return None
+        src = frame[off + 8:off + 24]
+        client = ':'.join(src[i:i + 2].hex() for i in range(0, 16, 2))
+        off += 40
+    else:
+        return None
+
+    dport = struct.unpack_from('!H', frame, off + 2)[0]
+    if dport != 53:
+        return None
+    dns = frame[off + 8:]
+    if len(dns) < 12 or dns[2] & 0x80:  # too short or a response (QR bit)
+        return None
+    domain = _parse_qname(dns, 12)
+    return (domain, client) if domain else None
+
+
+def read_pcap(path, chunk=4096):
+    """Yield lists of (domain, client) queries from a pcap file"""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+        magic = header[:4]
+        if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+            endian = '<'
+        elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+            endian = '>'
+        else:
+            raise ValueError(f"{path} is not a libpcap file (pcapng is not supported)")
+        linktype = struct.unpack(endian + 'I', header[20:24])[0]
+        record = struct.Struct(endian + 'IIII')
+
+        batch = []
+        while True:
+            rec = f.read(16)
+            if len(rec) < 16:
+                break
+            _, _, incl_len, _ = record.unpack(rec)
+            frame = f.read(incl_len)
+            try:
+                query = _dns_query(frame, linktype)
+            except (IndexError, struct.error):
+                continue
+            if query:
+                batch.append(query)
+                if len(batch) >= chunk:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+# ============================================
+# PIPELINE
+# ============================================
+class DnsPipeline:
+    """Dedup window + batch scoring + CSV sink"""
+
+    def __init__(self, csv_file=CSV_FILE, window=300.0, batch_size=5000, flush_interval=1.0):
+        self.csv_file = csv_file
+        self.window = window
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.last_seen = {}
+        self.pending = {}
+        self.last_flush = time.monotonic()
+        self.last_prune = self.last_flush
+        self.stats = {'queries': 0, 'scored': 0, 'anomalies': 0}
+        # Each flush's rows go out as one group commit
+        self.log = EventLog(csv_file)
+
+    def add(self, queries):
+        """Queue (domain, client) pairs, skipping domains already scored within the window"""
+        now = time.monotonic()
+        last_seen = self.last_seen
+        pending = self.pending
+        window = self.window
+        for domain, client in queries:
+            domain = normalize_domain(domain)
+            if not domain:
+                continue
+            seen = last_seen.get(domain)
+            if seen is not None and now - seen < window:
+                continue
+            last_seen[domain] = now
+            pending[domain] = client
+        self.stats['queries'] += len(queries)
+
+        if len(pending) >= self.batch_size or now - self.last_flush >= self.flush_interval:
+            self.flush()
+        if now - self.last_prune >= window:
+            cutoff = now - window
+            self.last_seen = {d: t for d, t in last_seen.items() if t >= cutoff}
+            self.last_prune = now
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        domains = list(self.pending)
+        clients = [self.pending[d] for d in domains]
+        self.pending = {}
+
+        results = detect_dns_anomalies(extract_dns_features(domains))
+        self.stats['scored'] += len(domains)
+
+        now = datetime.now()
+        timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+        anomalies = 0
+        for domain, client, result in zip(domains, clients, results):
+            if not result['is_anomaly']:
+                continue
+            anomalies += 1
+            self.log.append(PermissionEvent(
+                timestamp,
+                domain,
+                'dns',
+                'MEDIUM',
+                f"DNS model flagged query from {client} (score {result['anomaly_score']:.3f})",
+                'ML-DNS',
+                now.hour
+            ))
+        if anomalies:
+            self.log.commit()
+            self.stats['anomalies'] += anomalies
+            print(f"🟡 [DNS] {anomalies} anomalous domains in batch of {len(domains)}")
+
+    def close(self):
+        self.flush()
+        self.log.close()
+
+
+def parse_lines(lines):
+    queries = []
+    for line in lines:
+        q = parse_query_line(line)
+        if q:
+            queries.append(q)
+    return queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feed resolver query logs into the DNS detector")
+    parser.add_argument('source', help="resolver log file to follow, or a .pcap file with --pcap")
+    parser.add_argument('--pcap', action='store_true', help="read source as a libpcap capture")
+    parser.add_argument('--from-start', action='store_true', help="process the existing log before following")
+    parser.add_argument('--window', type=float, default=300.0, help="dedup window in seconds")
+    parser.add_argument('--batch', type=int, default=5000, help="max domains per scoring batch")
+    args = parser.parse_args()
+
+    # Every false positive becomes a MEDIUM row on the dashboard, so don't run
+    # with features that get well-known domains wrong
+    wrong = check_reference_domains()
+    if wrong:
+        parser.error(f"DNS features disagree with the model on {', '.join(wrong)}")
+
+    pipeline = DnsPipeline(window=args.window, batch_size=args.batch)
+    print(f"🔎 DNS pipeline reading {args.source}")
+    print(f"📁 Logging anomalies to: {pipeline.csv_file}")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # systemd stops services with SIGTERM; treat it like Ctrl-C so the
+    # buffered rows are committed
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        if args.pcap:
+            for queries in read_pcap(args.source):
+                pipeline.add(queries)
+        else:
+            for lines in follow(args.source, from_start=args.from_start):
+                pipeline.add(parse_lines(lines))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        pipeline.close()
+        print(f"📊 {pipeline.stats}")
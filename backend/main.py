@@ -1,63 +1,10 @@
-import joblib
-import numpy as np
-import pandas as pd
-from rules import rule_based_check
+import os
+import sys
 
-# Load your ML model (only once at startup)
-model = joblib.load('isolation_forest_model.pkl')
-encoder = joblib.load('onehot_encoder.pkl')
-
-def predict_anomaly(app_name, permission, hour):
-    """
-    ML-based anomaly detection using Isolation Forest
-    Returns: 1 for anomaly, 0 for normal
-    """
-    try:
-        # Normalize inputs
-        app_clean = app_name.lower().replace('.exe', '').strip()
-        perm_clean = permission.lower().strip()
-        
-        # Create DataFrame for encoding (avoids sklearn warnings)
-        X_new = pd.DataFrame([[app_clean, perm_clean]], 
-                            columns=['app_name', 'permission_type'])
-        
-        # Encode categorical features
-        X_encoded = encoder.transform(X_new)
-        
-        # Add hour feature
-        X_final = np.hstack([X_encoded, [[hour]]])
-        
-        # Predict: -1 = anomaly, 1 = normal in Isolation Forest
-        prediction = model.predict(X_final)[0]
-        
-        # Convert to our format: 1 = anomaly, 0 = normal
-        return 1 if prediction == -1 else 0
-        
-    except Exception as e:
-        print(f"⚠️ ML prediction error: {e}")
-        return 0  # Default to normal if error
-
-def hybrid_threat_detection(app_name, permission, hour):
-    """
-    Combines rule-based + ML detection
-    Returns: (threat_level, reason, layers_triggered)
-    """
-    layers_triggered = []
-    
-    # Layer 1: Rule-based (check rules.py)
-    rule_threat, rule_level, rule_reason = rule_based_check(app_name, permission, hour)
-    if rule_threat:
-        layers_triggered.append("Rule-Based")
-        return rule_level, rule_reason, layers_triggered
-    
-    # Layer 2: ML-based
-    ml_anomaly = predict_anomaly(app_name, permission, hour)
-    if ml_anomaly == 1:
-        layers_triggered.append("ML-Behavioral")
-        return "MEDIUM", "Machine learning detected unusual behavior pattern", layers_triggered
-    
-    # Normal - no threats detected
-    return "LOW", "Normal activity", []
+# Kept for `from main import ...` and as a self-test (python main.py);
+# detection/ is at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from detection import hybrid_threat_detection, predict_anomaly, score  # noqa: F401
 
 # Test when run directly
 if __name__ == "__main__":
@@ -72,7 +19,8 @@ if __name__ == "__main__":
     ]
     
     for app, perm, hour in test_cases:
-        level, reason, layers = hybrid_threat_detection(app, perm, hour)
+        verdict = score([{'app_name': app, 'permission_type': perm, 'hour': hour}])[0]
+        level, reason, layers = verdict['threat_level'], verdict['reason'], verdict['layers_triggered']
         
         # Color code output
         if level == "CRITICAL":
@@ -88,4 +36,76 @@ if __name__ == "__main__":
         print(f"   Level: {level}")
         print(f"   Reason: {reason}")
         print(f"   Layers: {', '.join(layers) if layers else 'None'}")
+        if verdict['anomaly_score'] is not None:
+            print(f"   Anomaly score: {verdict['anomaly_score']:.3f} (threshold {verdict['threshold']:.3f})")
         print()
+
+    # Cross-path consistency: batch score() vs per-event hybrid_threat_detection
+    # vs the original encoder.transform + model.predict path, over the model's
+    # whole input space (every known app, plus an unknown one, x permission x hour).
+    # Calibration is off here: the fixed threshold is what model.predict uses.
+    import numpy as np
+    import pandas as pd
+    from detection.model import load_permission_model
+
+    model = load_permission_model()
+    if model is None:
+        print("⚠️ Model not loaded - skipping consistency check")
+        sys.exit(0)
+
+    events = [
+        {'app_name': app, 'permission_type': perm, 'hour': hour}
+        for app in model.apps + ['unknownapp']
+        for perm in model.perms
+        for hour in range(24)
+    ]
+    batch = score(events, calibrate=False)
+
+    X = model.encoder.transform(pd.DataFrame(
+        [[e['app_name'], e['permission_type']] for e in events],
+        columns=['app_name', 'permission_type']))
+    legacy = model.model.predict(np.hstack([X, [[e['hour']] for e in events]]))
+
+    mismatches = 0
+    for event, verdict, legacy_pred in zip(events, batch, legacy):
+        single = hybrid_threat_detection(event['app_name'], event['permission_type'], event['hour'], calibrate=False)
+        if single != (verdict['threat_level'], verdict['reason'], verdict['layers_triggered']):
+            mismatches += 1
+        if verdict['ml_anomaly'] != (legacy_pred == -1):
+            mismatches += 1
+
+    print("=" * 60)
+    print(f"🔁 Consistency: {len(events)} events, {mismatches} mismatches")
+
+    # Calibration: replay a skewed stream (a few popular apps per permission)
+    # and compare each permission's adaptive threshold with the exact quantile
+    from detection.calibration import ScoreCalibrator
+
+    rng = np.random.default_rng(0)
+    calibrator = ScoreCalibrator(contamination=0.1, warmup=100, window=100000)
+    seen = {}
+    for _ in range(20000):
+        p = int(rng.integers(len(model.perms)))
+        a = int(min(rng.geometric(0.3) - 1, len(model.apps)))
+        s = float(model.table[a, p, int(rng.integers(24))])
+        calibrator.update(model.perms[p], s)
+        seen.setdefault(model.perms[p], []).append(s)
+
+    worst = 0.0
+    for perm, values in seen.items():
+        values = np.sort(values)
+        t = calibrator.threshold(perm, model.threshold)
+        # Judge by rank: how far the estimate's rank is from the 90th percentile
+        worst = max(worst, abs(np.searchsorted(values, t, side='right') / len(values) - 0.9))
+    print(f"📏 Calibration: {len(seen)} permissions, worst threshold rank error {worst:.3f}")
+    if worst > 0.05:
+        mismatches += 1
+
+    # DNS: raw-domain features must reproduce the model's verdicts on known domains
+    from detection.dns import REFERENCE_DOMAINS, check_reference_domains
+
+    wrong = check_reference_domains()
+    print(f"🌐 DNS features: {len(REFERENCE_DOMAINS)} reference domains, {len(wrong)} wrong"
+          + (f": {', '.join(wrong)}" if wrong else ""))
+    mismatches += len(wrong)
+    sys.exit(1 if mismatches else 0)
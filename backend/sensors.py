@@ -0,0 +1,163 @@
+# sensors.py - Detect real camera/microphone use on Linux
+#
+# A process is using the camera when it holds an open fd on /dev/video*, and
+# the microphone when it holds one on an ALSA capture device
+# (/dev/snd/pcmC*D*c). DeviceSensor finds those by scanning /proc/<pid>/fd:
+#   - device nodes are identified by (st_dev, st_ino), from a map that is only
+#     rebuilt when /dev or /dev/snd changes
+#   - per PID it remembers the fd numbers it has already resolved, so a sweep
+#     only stat()s fds that are new since the previous one (plus the few that
+#     are device handles); every full_rescan_every sweeps all fds are
+#     re-resolved to catch an fd number that was closed and reused
+#   - events are emitted when a (process, permission) starts, not every sweep
+
+import os
+import re
+import sys
+from datetime import datetime
+
+from detection.events import PermissionEvent
+
+CAPTURE_PCM_RE = re.compile(r'^pcmC\d+D\d+c$')
+
+
+def sensor_available(proc_dir='/proc'):
+    return sys.platform.startswith('linux') and os.path.isdir(proc_dir)
+
+
+class DeviceSensor:
+    def __init__(self, proc_dir='/proc', dev_dir='/dev', full_rescan_every=6):
+        self.proc_dir = proc_dir
+        self.dev_dir = dev_dir
+        self.snd_dir = os.path.join(dev_dir, 'snd')
+        self.full_rescan_every = full_rescan_every
+        self.devices = {}       # (st_dev, st_ino) -> 'camera' / 'microphone'
+        self._dev_stamp = None
+        self.procs = {}         # pid -> (identity, {fd: permission or None})
+        self.active = {}        # pid -> set of permissions in use last sweep
+        self.sweeps = 0
+
+    # ============================================
+    # DEVICE MAP
+    # ============================================
+    def _stamp(self):
+        stamp = []
+        for d in (self.dev_dir, self.snd_dir):
+            try:
+                stamp.append(os.stat(d).st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def refresh_devices(self):
+        """Rebuild the inode -> device map if /dev or /dev/snd changed"""
+        stamp = self._stamp()
+        if stamp == self._dev_stamp:
+            return False
+        self._dev_stamp = stamp
+
+        devices = {}
+        candidates = []
+        try:
+            candidates += [(e.path, 'camera') for e in os.scandir(self.dev_dir) if e.name.startswith('video')]
+        except OSError:
+            pass
+        try:
+            candidates += [(e.path, 'microphone') for e in os.scandir(self.snd_dir) if CAPTURE_PCM_RE.match(e.name)]
+        except OSError:
+            pass
+        for path, permission in candidates:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            devices[(st.st_dev, st.st_ino)] = permission
+        self.devices = devices
+        # Cached fd resolutions refer to the old map
+        self.procs = {}
+        return True
+
+    # ============================================
+    # SWEEP
+    # ============================================
+    def _resolve(self, fd_dir, fd):
+        try:
+            st = os.stat(f'{fd_dir}/{fd}')
+        except OSError:
+            return None
+        return self.devices.get((st.st_dev, st.st_ino))
+
+    def _scan_pid(self, pid, full):
+        """Returns: set of permissions pid is using now (empty if unreadable)"""
+        base = f'{self.proc_dir}/{pid}'
+        fd_dir = f'{base}/fd'
+        try:
+            identity = os.stat(base).st_ctime_ns
+            fds = os.listdir(fd_dir)
+        except OSError:
+            self.procs.pop(pid, None)
+            return set()
+
+        cached = self.procs.get(pid)
+        if full or cached is None or cached[0] != identity:
+            known = {}
+        else:
+            known = cached[1]
+
+        resolved = {}
+        in_use = set()
+        for fd in fds:
+            # Device fds are always re-checked so a stop is seen promptly
+            permission = known.get(fd, False)
+            if permission is False or permission:
+                permission = self._resolve(fd_dir, fd)
+            resolved[fd] = permission
+            if permission:
+                in_use.add(permission)
+        self.procs[pid] = (identity, resolved)
+        return in_use
+
+    def _name(self, pid):
+        try:
+            with open(f'{self.proc_dir}/{pid}/comm') as f:
+                return f.read().strip()
+        except OSError:
+            return f'pid-{pid}'
+
+    def sweep(self):
+        """
+        Scan every process once
+        Returns: list of PermissionEvent (with pid) for camera/microphone use that started since the last sweep
+        """
+        self.refresh_devices()
+        self.sweeps += 1
+        full = self.full_rescan_every and self.sweeps % self.full_rescan_every == 0
+
+        if not self.devices:
+            self.active = {}
+            return []
+
+        pids = [e.name for e in os.scandir(self.proc_dir) if e.name.isdigit()]
+        now = datetime.now()
+        timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+
+        active = {}
+        events = []
+        for pid in pids:
+            in_use = self._scan_pid(pid, full)
+            if not in_use:
+                continue
+            active[pid] = in_use
+            started = in_use - self.active.get(pid, set())
+            if started:
+                name = self._name(pid)
+                for permission in sorted(started):
+                    events.append(PermissionEvent(timestamp, name, permission, hour=now.hour, pid=int(pid)))
+
+        # Forget processes that exited
+        alive = set(pids)
+        for pid in list(self.procs):
+            if pid not in alive:
+                del self.procs[pid]
+        self.active = active
+        return events
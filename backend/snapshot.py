@@ -0,0 +1,104 @@
+# snapshot.py - Precomputed /apps/simple view for dashboard polling
+#
+# Every open dashboard polls /apps/simple every 5 seconds. Instead of
+# re-reading and regrouping the whole CSV per poll, AppsSnapshot folds only
+# the rows appended since the last poll into a per-app summary, re-serializes
+# the JSON only when that summary changed, and keeps an ETag/Last-Modified
+# pair so unchanged polls can be answered with 304 Not Modified.
+
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+from email.utils import formatdate
+
+from detection.events import HEADERS, dumps
+
+THREAT_LEVELS = {'CRITICAL': 3, 'HIGH': 2, 'MEDIUM': 1}
+
+
+class AppsSnapshot:
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.header_skipped = False
+        self.apps = {}          # app_name -> [set of permissions, max level rank]
+        self.body = None
+        self.etag = None
+        self.last_modified = None
+
+    def refresh(self):
+        """
+        Fold in rows appended since the last call
+        Returns: (body bytes, etag, last_modified)
+        """
+        with self.lock:
+            st = os.stat(self.csv_file)
+            if st.st_ino != self.inode or st.st_size < self.offset:
+                # New or truncated file: start over
+                self._reset(st.st_ino)
+            changed = False
+            if st.st_size > self.offset:
+                changed = self._read_new_rows()
+            if changed or self.body is None:
+                self._serialize()
+            return self.body, self.etag, self.last_modified
+
+    def _read_new_rows(self):
+        with open(self.csv_file, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Only consume complete lines; a row still being written stays for next time
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return False
+        self.offset += end
+
+        rows = csv.reader(io.StringIO(data[:end].decode('utf-8', 'replace')))
+        if not self.header_skipped:
+            next(rows, None)
+            self.header_skipped = True
+
+        changed = False
+        for row in rows:
+            if len(row) != len(HEADERS):
+                continue
+            rank = THREAT_LEVELS.get(row[3])
+            if rank is None:
+                continue
+            entry = self.apps.get(row[1])
+            if entry is None:
+                entry = self.apps[row[1]] = [set(), 0]
+            if row[2] not in entry[0] or rank > entry[1]:
+                entry[0].add(row[2])
+                entry[1] = max(entry[1], rank)
+                changed = True
+        return changed
+
+    def _serialize(self):
+        names = {rank: level for level, rank in THREAT_LEVELS.items()}
+        apps = [
+            {'name': name, 'permissions': sorted(perms), 'threat_level': names[rank]}
+            for name, (perms, rank) in self.apps.items()
+        ]
+        apps.sort(key=lambda x: THREAT_LEVELS[x['threat_level']], reverse=True)
+        body = dumps({"success": True, "apps": apps})
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if etag != self.etag:
+            self.last_modified = formatdate(time.time(), usegmt=True)
+        self.body, self.etag = body, etag
+
+
+def not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """True if the client's cached copy (by ETag, else Last-Modified) is current"""
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(',')]
+        return etag in tags or '*' in tags
+    return if_modified_since is not None and if_modified_since == last_modified
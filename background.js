@@ -4,11 +4,33 @@ console.log("🔒 Permission Watcher extension loaded successfully!");
 
 // Backend API URL
 const API_URL = 'http://localhost:8000';
+const BACKEND_TIMEOUT_MS = 1500;
 
 // Storage for tracking permission usage
-let permissionLog = [];
 let suspiciousActivity = [];
 
+// permissionLog is stored in fixed-size chunks (permissionLog_<n>) so each
+// event rewrites at most one chunk instead of the whole log
+const LOG_CHUNK_SIZE = 50;
+const LOG_MAX_CHUNKS = 10;  // 500 entries
+let logMeta = { head: 0, tail: 0 };
+let logChunk = [];
+
+// Offline scoring bundle served by the backend at /bundle (see main.py)
+let scoringBundle = null;
+
+// Locally scored events waiting to be synced to the backend, stored like
+// permissionLog in chunks (syncQueue_<n>), one batch per chunk
+const SYNC_BATCH_SIZE = 50;
+const SYNC_QUEUE_MAX = 1000;
+const SYNC_MAX_CHUNKS = SYNC_QUEUE_MAX / SYNC_BATCH_SIZE;
+let syncMeta = { head: 0, tail: 0 };
+let syncChunk = [];
+
+// The pending/granted events of one request share a single verdict
+const COALESCE_WINDOW_MS = 5000;
+const recentVerdicts = new Map();
+
 // ============================================
 // INITIALIZATION
 // ============================================
@@ -24,8 +46,8 @@ chrome.runtime.onInstalled.addListener(() => {
   });
   
   // Initialize storage
+  resetPermissionLog();
   chrome.storage.local.set({
-    permissionLog: [],
     suspiciousActivity: [],
     isMonitoring: true
   });
@@ -34,6 +56,49 @@ chrome.runtime.onInstalled.addListener(() => {
   testBackendConnection();
 });
 
+// Periodic background sync and bundle / policy refresh. Created at top level
+// because Chrome may clear alarms on a browser restart, which doesn't fire
+// onInstalled; the get() guard keeps an existing alarm's schedule.
+const ALARMS = { syncEvents: 1, refreshBundle: 30, refreshPolicy: 5 };  // minutes
+for (const [name, periodInMinutes] of Object.entries(ALARMS)) {
+  chrome.alarms.get(name).then(alarm => {
+    if (!alarm) {
+      chrome.alarms.create(name, { periodInMinutes });
+    }
+  });
+}
+
+chrome.alarms.onAlarm.addListener((alarm) => {
+  if (alarm.name === 'syncEvents') {
+    flushSyncQueue();
+  }
+  if (alarm.name === 'refreshBundle') {
+    refreshScoringBundle();
+  }
+  if (alarm.name === 'refreshPolicy') {
+    refreshPolicy();
+  }
+});
+
+// Restore state the service worker lost when it was suspended
+const stateReady = chrome.storage.local.get([
+  'scoringBundle', 'syncQueueMeta', 'permissionLogMeta'
+]).then(async (stored) => {
+  if (stored.scoringBundle) {
+    scoringBundle = compileBundle(stored.scoringBundle);
+  }
+  if (stored.syncQueueMeta) {
+    syncMeta = stored.syncQueueMeta;
+    const key = `syncQueue_${syncMeta.head}`;
+    syncChunk = (await chrome.storage.local.get(key))[key] || [];
+  }
+  if (stored.permissionLogMeta) {
+    logMeta = stored.permissionLogMeta;
+    const key = `permissionLog_${logMeta.head}`;
+    logChunk = (await chrome.storage.local.get(key))[key] || [];
+  }
+});
+
 // ============================================
 // TEST BACKEND CONNECTION
 // ============================================
@@ -99,10 +164,251 @@ chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
   return true;
 });
 
+// ============================================
+// OFFLINE SCORING BUNDLE
+// ============================================
+async function refreshScoringBundle() {
+  try {
+    const { scoringBundleEtag } = await chrome.storage.local.get('scoringBundleEtag');
+    const headers = scoringBundleEtag ? { 'If-None-Match': scoringBundleEtag } : {};
+    const response = await fetchWithTimeout(`${API_URL}/bundle`, { headers });
+    
+    if (response.status === 304) {
+      console.log('📦 Scoring bundle up to date');
+      return;
+    }
+    if (!response.ok) {
+      throw new Error(`Backend error: ${response.status}`);
+    }
+    
+    const bundle = await response.json();
+    scoringBundle = compileBundle(bundle);
+    chrome.storage.local.set({
+      scoringBundle: bundle,
+      scoringBundleEtag: response.headers.get('ETag')
+    });
+    console.log('📦 Scoring bundle updated:', bundle.version);
+  } catch (error) {
+    console.warn('⚠️ Could not refresh scoring bundle:', error.message);
+  }
+}
+
+// ============================================
+// ENFORCEMENT POLICY
+// ============================================
+// The decision table lives in chrome.storage.local; content_script.js hands
+// it to every page's injected script, which decides synchronously
+async function refreshPolicy() {
+  try {
+    const { policyEtag } = await chrome.storage.local.get('policyEtag');
+    const headers = policyEtag ? { 'If-None-Match': policyEtag } : {};
+    const response = await fetchWithTimeout(`${API_URL}/policy`, { headers });
+    
+    if (response.status === 304) {
+      return;
+    }
+    if (!response.ok) {
+      throw new Error(`Backend error: ${response.status}`);
+    }
+    
+    const policy = await response.json();
+    chrome.storage.local.set({
+      policy: policy,
+      policyEtag: response.headers.get('ETag')
+    });
+    console.log(`🛡️ Policy updated (${policy.mode}):`, policy.version);
+  } catch (error) {
+    console.warn('⚠️ Could not refresh policy:', error.message);
+  }
+}
+
+function decodeBytes(b64) {
+  const raw = atob(b64);
+  const bytes = new Uint8Array(raw.length);
+  for (let i = 0; i < raw.length; i++) bytes[i] = raw.charCodeAt(i);
+  return bytes;
+}
+
+// Precompute lookups so scoreLocally does no allocation-heavy work per event
+function compileBundle(bundle) {
+  let model = null;
+  if (bundle.model) {
+    model = {
+      appIndex: new Map(bundle.model.apps.map((a, i) => [a, i])),
+      permIndex: new Map(bundle.model.perms.map((p, i) => [p, i])),
+      nApps: bundle.model.apps.length,
+      nPerms: bundle.model.perms.length,
+      scoreMin: bundle.model.score_range[0],
+      scoreMax: bundle.model.score_range[1],
+      scores: decodeBytes(bundle.model.scores),
+      anomalies: decodeBytes(bundle.model.anomalies)
+    };
+  }
+  return {
+    version: bundle.version,
+    model: model,
+    rules: bundle.rules.map(rule => ({
+      apps: new Set(rule.apps),
+      perms: new Set(rule.perms),
+      hourMask: rule.hours === null ? -1 : rule.hours.reduce((mask, h) => mask | (1 << h), 0),
+      level: rule.level.toLowerCase(),
+      reason: rule.reason
+    }))
+  };
+}
+
+// Mirrors detection/engine.py:score() + main.py:to_api_result()
+function scoreLocally(bundle, appName, permission, hour) {
+  const app = appName.toLowerCase().replaceAll('.exe', '').trim();
+  const perm = permission.toLowerCase().trim();
+  const parts = [perm, ...perm.split('_')];
+  const hourBit = 1 << (hour % 24);
+  
+  let anomalyScore = 0.5;
+  let mlPred = 0;
+  if (bundle.model) {
+    const m = bundle.model;
+    const appIdx = m.appIndex.has(app) ? m.appIndex.get(app) : m.nApps;
+    const permIdx = m.permIndex.has(perm) ? m.permIndex.get(perm) : m.nPerms;
+    const cell = (appIdx * (m.nPerms + 1) + permIdx) * 24 + (hour % 24);
+    anomalyScore = m.scoreMin + (m.scores[cell] / 255) * (m.scoreMax - m.scoreMin);
+    // Verdict bits already use the server's calibrated threshold for this permission
+    mlPred = (m.anomalies[cell >> 3] >> (7 - (cell & 7))) & 1 ? -1 : 1;
+  }
+  
+  let threat = 'low';
+  let reason = 'Normal activity';
+  let layers = [];
+  const rule = bundle.rules.find(r =>
+    (r.apps.size === 0 || r.apps.has(app)) &&
+    (r.perms.size === 0 || parts.some(p => r.perms.has(p))) &&
+    (r.hourMask & hourBit) !== 0);
+  
+  if (rule) {
+    threat = rule.level;
+    reason = rule.reason
+      .replace('{app}', app)
+      .replace('{perm}', perm)
+      .replace('{Perm}', perm.charAt(0).toUpperCase() + perm.slice(1))
+      .replace('{hour}', hour);
+    layers = ['Rule-Based'];
+  } else if (mlPred === -1) {
+    threat = 'medium';
+    reason = 'Machine learning detected unusual behavior pattern';
+    layers = ['ML-Behavioral'];
+  }
+  
+  return {
+    threat_level: threat,
+    anomaly_score: anomalyScore,
+    calibrated_score: null,
+    reason: reason,
+    layers_triggered: layers,
+    ml_prediction: mlPred,
+    confidence: mlPred === -1 ? anomalyScore : 1 - anomalyScore,
+    source: 'local',
+    bundle_version: bundle.version
+  };
+}
+
+function fetchWithTimeout(url, options = {}) {
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), BACKEND_TIMEOUT_MS);
+  return fetch(url, { ...options, signal: controller.signal })
+    .finally(() => clearTimeout(timer));
+}
+
+// ============================================
+// BACKGROUND SYNC (batched)
+// ============================================
+function queueForSync(requestData) {
+  syncChunk.push(requestData);
+  const update = { [`syncQueue_${syncMeta.head}`]: syncChunk };
+  const full = syncChunk.length >= SYNC_BATCH_SIZE;
+  if (full) {
+    sealSyncChunk(update);
+  }
+  chrome.storage.local.set(update);
+  
+  if (full) {
+    flushSyncQueue();
+  }
+}
+
+// Start a new head chunk; past SYNC_MAX_CHUNKS the oldest one is dropped
+function sealSyncChunk(update) {
+  syncMeta.head += 1;
+  syncChunk = [];
+  if (syncMeta.head - syncMeta.tail > SYNC_MAX_CHUNKS) {
+    chrome.storage.local.remove(`syncQueue_${syncMeta.tail}`);
+    syncMeta.tail += 1;
+  }
+  update.syncQueueMeta = { ...syncMeta };
+}
+
+let syncInProgress = false;
+
+async function flushSyncQueue() {
+  await stateReady;
+  if (syncInProgress) return;
+  if (syncMeta.tail === syncMeta.head && syncChunk.length > 0) {
+    // Nothing sealed is waiting: send the partial head chunk as a batch and
+    // let new events go to the next chunk
+    const update = {};
+    sealSyncChunk(update);
+    chrome.storage.local.set(update);
+  }
+  if (syncMeta.tail === syncMeta.head) return;
+  syncInProgress = true;
+  
+  try {
+    while (syncMeta.tail < syncMeta.head) {
+      const key = `syncQueue_${syncMeta.tail}`;
+      const batch = (await chrome.storage.local.get(key))[key] || [];
+      if (batch.length === 0) {
+        syncMeta.tail += 1;
+        chrome.storage.local.set({ syncQueueMeta: { ...syncMeta } });
+        continue;
+      }
+      const response = await fetchWithTimeout(`${API_URL}/check-permission/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ events: batch })
+      });
+      if (!response.ok) {
+        throw new Error(`Backend error: ${response.status}`);
+      }
+      
+      const data = await response.json();
+      // The chunk may have been dropped as the oldest while we waited
+      if (key === `syncQueue_${syncMeta.tail}`) {
+        chrome.storage.local.remove(key);
+        syncMeta.tail += 1;
+        chrome.storage.local.set({ syncQueueMeta: { ...syncMeta } });
+      }
+      console.log(`🔄 Synced ${data.received} events to backend`);
+      
+      // A verdict mismatch means our bundle is stale
+      const stale = data.results.some((result, i) =>
+        result.threat_level && result.threat_level !== batch[i].local_threat_level);
+      if (stale) {
+        refreshScoringBundle();
+      }
+    }
+  } catch (error) {
+    const queued = (syncMeta.head - syncMeta.tail) * SYNC_BATCH_SIZE;
+    console.warn(`⚠️ Sync deferred (up to ${queued} queued):`, error.message);
+  } finally {
+    syncInProgress = false;
+  }
+}
+
 // ============================================
 // HANDLE PERMISSION EVENT (Main ML Analysis)
 // ============================================
 async function handlePermissionEvent(eventData, tab) {
+  await stateReady;
+  
   try {
     const hostname = new URL(tab.url).hostname;
     
@@ -116,28 +422,32 @@ async function handlePermissionEvent(eventData, tab) {
       url: tab.url
     };
     
-    console.log('📤 Sending to Isolation Forest backend:', requestData);
+    // Coalesce the pending/granted pair of one request into a single verdict
+    const key = `${tab.id}|${hostname}|${eventData.permission}`;
+    const now = Date.now();
+    const recent = recentVerdicts.get(key);
+    const coalesced = recent && now - recent.time < COALESCE_WINDOW_MS;
     
-    // Send to FastAPI backend with ML model
-    const response = await fetch(`${API_URL}/check-permission`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify(requestData)
-    });
-    
-    if (!response.ok) {
-      throw new Error(`Backend error: ${response.status}`);
+    let verdict;
+    if (coalesced) {
+      verdict = recent.verdict;
+    } else {
+      verdict = scorePermissionRequest(requestData);
+      verdict.catch(() => recentVerdicts.delete(key));
+      recentVerdicts.set(key, { verdict: verdict, time: now });
+      for (const [k, v] of recentVerdicts) {
+        if (now - v.time >= COALESCE_WINDOW_MS) recentVerdicts.delete(k);
+      }
     }
     
-    const result = await response.json();
+    const result = await verdict;
     
     console.log('📥 ML ANALYSIS RESULT:');
     console.log('   Threat Level:', result.threat_level);
     console.log('   Anomaly Score:', result.anomaly_score);
     console.log('   Reason:', result.reason);
     console.log('   Layers:', result.layers_triggered);
+    console.log('   Source:', result.source || 'backend');
     
     // Log the activity
     const activity = {
@@ -147,18 +457,21 @@ async function handlePermissionEvent(eventData, tab) {
       tabId: tab.id,
       timestamp: eventData.timestamp,
       granted: eventData.granted,
+      policyDecision: eventData.decision,
       mlAnalysis: result
     };
     
     logPermissionActivity(activity);
     
-    // Show notification based on ML threat assessment
-    showMLNotification(result, hostname, eventData.permission);
-    
-    // Flag if suspicious
-    if (result.threat_level === 'high' || result.threat_level === 'critical') {
-      suspiciousActivity.push(activity);
-      chrome.storage.local.set({ suspiciousActivity: suspiciousActivity });
+    if (!coalesced) {
+      // Show notification based on ML threat assessment
+      showMLNotification(result, hostname, eventData.permission);
+      
+      // Flag if suspicious
+      if (result.threat_level === 'high' || result.threat_level === 'critical') {
+        suspiciousActivity.push(activity);
+        chrome.storage.local.set({ suspiciousActivity: suspiciousActivity });
+      }
     }
     
     return {
@@ -195,6 +508,35 @@ async function handlePermissionEvent(eventData, tab) {
   }
 }
 
+// Local bundle first (no network on the prompt path); backend only when no bundle is cached yet
+async function scorePermissionRequest(requestData) {
+  if (scoringBundle) {
+    const hour = new Date(requestData.timestamp).getUTCHours();
+    const result = scoreLocally(scoringBundle, requestData.app_name, requestData.permission_type, hour);
+    queueForSync({ ...requestData, local_threat_level: result.threat_level });
+    return result;
+  }
+  
+  console.log('📤 Sending to Isolation Forest backend:', requestData);
+  
+  const response = await fetchWithTimeout(`${API_URL}/check-permission`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(requestData)
+  });
+  
+  if (!response.ok) {
+    throw new Error(`Backend error: ${response.status}`);
+  }
+  
+  // Backend is reachable again - pick up the bundle and policy for next time
+  refreshScoringBundle();
+  refreshPolicy();
+  return response.json();
+}
+
 // ============================================
 // SHOW ML-POWERED NOTIFICATION
 // ============================================
@@ -262,17 +604,39 @@ function handleLegacyPermissionGranted(data, tab) {
 // ACTIVITY LOGGING
 // ============================================
 function logPermissionActivity(activity) {
-  permissionLog.push(activity);
-  
-  // Keep only last 500 entries
-  if (permissionLog.length > 500) {
-    permissionLog = permissionLog.slice(-500);
-  }
-  
-  // Save to storage
-  chrome.storage.local.set({ permissionLog: permissionLog });
-  
-  console.log(`💾 Activity logged (Total: ${permissionLog.length})`);
+  stateReady.then(() => {
+    logChunk.push(activity);
+    const update = { [`permissionLog_${logMeta.head}`]: logChunk };
+    
+    // Chunk full: start a new one and drop the oldest beyond 500 entries
+    if (logChunk.length >= LOG_CHUNK_SIZE) {
+      logMeta.head += 1;
+      logChunk = [];
+      if (logMeta.head - logMeta.tail >= LOG_MAX_CHUNKS) {
+        chrome.storage.local.remove(`permissionLog_${logMeta.tail}`);
+        logMeta.tail += 1;
+      }
+      update.permissionLogMeta = { ...logMeta };
+    }
+    
+    // Save to storage (only the current chunk is rewritten)
+    chrome.storage.local.set(update);
+    
+    console.log(`💾 Activity logged (chunk ${logMeta.head}, ${logChunk.length} entries)`);
+  });
+}
+
+function resetPermissionLog() {
+  stateReady.then(() => {
+    const oldKeys = [];
+    for (let i = logMeta.tail; i <= logMeta.head; i++) {
+      oldKeys.push(`permissionLog_${i}`);
+    }
+    chrome.storage.local.remove(oldKeys.concat(['permissionLog']));
+    logMeta = { head: 0, tail: 0 };
+    logChunk = [];
+    chrome.storage.local.set({ permissionLogMeta: logMeta, permissionLog_0: [] });
+  });
 }
 
 // ============================================
@@ -330,3 +694,6 @@ console.log("⏳ Waiting for permission events...");
 
 // Test backend on startup
 testBackendConnection();
+refreshScoringBundle();
+refreshPolicy();
+flushSyncQueue();
@@ -9,6 +9,76 @@
     const originalGetUserMedia = navigator.mediaDevices.getUserMedia.bind(navigator.mediaDevices);
     const originalGeolocation = navigator.geolocation.getCurrentPosition.bind(navigator.geolocation);
     const originalNotification = window.Notification ? window.Notification.requestPermission.bind(window.Notification) : null;
+    // Captured now so a page can't replace window.confirm to answer "ask" prompts
+    const originalConfirm = window.confirm.bind(window);
+    
+    // ============================================
+    // POLICY (decision table from the backend's /policy)
+    // ============================================
+    // content_script.js hands over the table it has at injection time in our
+    // data-policy attribute, so decide() has it from the first call, and pushes
+    // later updates on a random event name that only this script learns (from
+    // its own data-channel attribute), so the page can't listen in or forge
+    // updates. Without any table (never fetched) everything is allowed.
+    const script = document.currentScript;
+    const policyChannel = script ? script.dataset.channel : null;
+    const initialPolicy = script ? script.dataset.policy : null;
+    if (script) {
+        delete script.dataset.channel;
+        delete script.dataset.policy;
+    }
+    const DECISIONS = ['allow', 'ask', 'deny'];
+    
+    function compilePolicy(body) {
+        const raw = atob(body.decisions);
+        const decisions = new Uint8Array(raw.length);
+        for (let i = 0; i < raw.length; i++) decisions[i] = raw.charCodeAt(i);
+        return {
+            mode: body.mode,
+            appIndex: new Map(body.apps.map((a, i) => [a, i])),
+            permIndex: new Map(body.perms.map((p, i) => [p, i])),
+            nApps: body.apps.length,
+            nPerms: body.perms.length,
+            decisions: decisions,
+            overrides: body.overrides || {}
+        };
+    }
+    
+    let policy = initialPolicy ? compilePolicy(JSON.parse(initialPolicy)) : null;
+    
+    if (policyChannel) {
+        document.addEventListener(policyChannel, event => {
+            policy = compilePolicy(JSON.parse(event.detail));
+            console.log('🛡️ Permission policy loaded:', policy.mode);
+        });
+    }
+    
+    // Synchronous lookup, mirrors PolicyTable.decide in detection/policy.py
+    function decide(permissionType) {
+        if (!policy) return 'allow';
+        const app = window.location.hostname.toLowerCase().replaceAll('.exe', '').trim();
+        const perm = permissionType.toLowerCase().trim();
+        const override = policy.overrides[app];
+        if (override) {
+            const decision = override[perm] || override['*'];
+            if (decision) return decision;
+        }
+        const appIdx = policy.appIndex.has(app) ? policy.appIndex.get(app) : policy.nApps;
+        const permIdx = policy.permIndex.has(perm) ? policy.permIndex.get(perm) : policy.nPerms;
+        const hour = new Date().getUTCHours();
+        return DECISIONS[policy.decisions[(appIdx * (policy.nPerms + 1) + permIdx) * 24 + hour]];
+    }
+    
+    // Returns: true if the request may go ahead; only blocks in enforce mode
+    function enforce(permissionType) {
+        const decision = decide(permissionType);
+        if (!policy || policy.mode !== 'enforce' || decision === 'allow') return true;
+        if (decision === 'ask') {
+            return originalConfirm(`Permission Firewall: ${window.location.hostname} wants to use your ${permissionType.replace('_', ' and ')}. Allow?`);
+        }
+        console.log('⛔ Blocked by policy:', permissionType);
+        return false;
+    }
     
     // Helper function to send permission event
     function sendPermissionEvent(permissionType, origin, granted) {
@@ -18,7 +88,8 @@
             origin: window.location.origin,
             url: window.location.href,
             timestamp: new Date().toISOString(),
-            granted: granted
+            granted: granted,
+            decision: decide(permissionType)
         };
         
         console.log('🔔 Permission Event:', event);
@@ -45,6 +116,11 @@
         // Send detection event immediately
         sendPermissionEvent(permissionType, window.location.origin, 'pending');
         
+        if (!enforce(permissionType)) {
+            sendPermissionEvent(permissionType, window.location.origin, false);
+            return Promise.reject(new DOMException('Permission denied by Permission Firewall policy', 'NotAllowedError'));
+        }
+        
         return originalGetUserMedia(constraints)
             .then(stream => {
                 console.log('✅ Permission GRANTED:', permissionType);
@@ -63,6 +139,15 @@
         console.log('📍 Location request detected');
         sendPermissionEvent('location', window.location.origin, 'pending');
         
+        if (!enforce('location')) {
+            sendPermissionEvent('location', window.location.origin, false);
+            if (error) {
+                error({ code: 1, message: 'Permission denied by Permission Firewall policy',
+                        PERMISSION_DENIED: 1, POSITION_UNAVAILABLE: 2, TIMEOUT: 3 });
+            }
+            return;
+        }
+        
         const wrappedSuccess = function(position) {
             console.log('✅ Location permission GRANTED');
             sendPermissionEvent('location', window.location.origin, true);
@@ -84,6 +169,11 @@
             console.log('🔔 Notification request detected');
             sendPermissionEvent('notification', window.location.origin, 'pending');
             
+            if (!enforce('notification')) {
+                sendPermissionEvent('notification', window.location.origin, false);
+                return Promise.resolve('denied');
+            }
+            
             return originalNotification().then(result => {
                 console.log('✅ Notification permission:', result);
                 sendPermissionEvent('notification', window.location.origin, result === 'granted');
@@ -27,14 +27,37 @@ window.addEventListener('message', function(event) {
     }
 });
 
-// Inject the permission detector into page context
-function injectPermissionDetector() {
+// Policy updates go to the injected script on a random event name it reads
+// from its own data-channel attribute (see content_injector.js)
+const policyChannel = 'pf-policy-' + crypto.randomUUID();
+
+function pushPolicy(policy) {
+    if (policy) {
+        document.dispatchEvent(new CustomEvent(policyChannel, { detail: JSON.stringify(policy) }));
+    }
+}
+
+chrome.storage.onChanged.addListener((changes, area) => {
+    if (area === 'local' && changes.policy) {
+        pushPolicy(changes.policy.newValue);
+    }
+});
+
+// Inject the permission detector into page context, with the current policy
+// table as an attribute so enforcement never starts without one
+function injectPermissionDetector(policy) {
     const script = document.createElement('script');
     script.src = chrome.runtime.getURL('content_injector.js');
+    script.dataset.channel = policyChannel;
+    if (policy) {
+        script.dataset.policy = JSON.stringify(policy);
+    }
     
     script.onload = function() {
         console.log('✅ Permission detector injected successfully');
         this.remove();
+        // Catch an update stored while the script was loading
+        chrome.storage.local.get('policy').then(({ policy }) => pushPolicy(policy));
     };
     
     script.onerror = function() {
@@ -45,7 +68,9 @@ function injectPermissionDetector() {
     (document.head || document.documentElement).appendChild(script);
 }
 
-// Inject on load
-injectPermissionDetector();
+// Inject on load, once the stored policy has been read
+chrome.storage.local.get('policy')
+    .then(({ policy }) => injectPermissionDetector(policy))
+    .catch(() => injectPermissionDetector(null));
 
 console.log('✅ Content script initialization complete');
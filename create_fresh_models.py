@@ -3,15 +3,22 @@
 from sklearn.ensemble import IsolationForest
 import pickle
 import numpy as np
-import sys
-import os
 
-# Add current directory to path
-sys.path.insert(0, os.getcwd())
-
-# Import SimpleEncoder from main
-print("🔍 Importing SimpleEncoder from main.py...")
-from main import SimpleEncoder
+# SimpleEncoder definition (main.py no longer carries its own encoder)
+class SimpleEncoder:
+    def __init__(self):
+        self.categories_ = [['camera', 'microphone', 'camera_microphone', 'location', 'notification']]
+        self.mapping = {
+            'camera': np.array([[1, 0, 0, 0, 0]]),
+            'microphone': np.array([[0, 1, 0, 0, 0]]),
+            'camera_microphone': np.array([[0, 0, 1, 0, 0]]),
+            'location': np.array([[0, 0, 0, 1, 0]]),
+            'notification': np.array([[0, 0, 0, 0, 1]])
+        }
+
+    def transform(self, X):
+        perm = X[0][0] if isinstance(X[0], list) else X[0]
+        return self.mapping.get(perm, np.array([[0, 0, 0, 0, 0]]))
 
 print("🤖 Creating ML models...")
 
@@ -0,0 +1,6 @@
+"""Shared detection engine used by main.py, backend/ and the batch tools"""
+
+from .engine import hybrid_threat_detection, predict_anomaly, score
+from .model import load_permission_model
+from .rules import RULES, rule_based_check
+from .events import LEVELS, EventBatch, PermissionEvent
@@ -0,0 +1,169 @@
+# calibration.py - Online score calibration with streaming quantile sketches
+#
+# The forest's contamination-based threshold is fixed at training time. Here
+# each key (permission type) keeps P^2 estimators (Jain & Chlamtac, 1985) for
+# a handful of quantiles of its recent anomaly scores, so the anomaly
+# threshold follows our own traffic without retraining. P^2 stores 5 markers
+# per quantile, so a key costs O(1) memory however many scores it has seen.
+# "Recent" is a pair of rotating windows: scores go into the current sketch,
+# and once it holds `window` scores it replaces the previous one.
+
+QUANTILES = (0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+class P2Quantile:
+    """P^2 streaming estimate of one quantile p"""
+    __slots__ = ('p', 'n', 'q', 'pos', 'want', 'dwant')
+
+    def __init__(self, p):
+        self.p = p
+        self.n = 0
+        self.q = []                                   # marker heights
+        self.pos = [1, 2, 3, 4, 5]                    # marker positions
+        self.want = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.dwant = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        self.n += 1
+        q = self.q
+        if self.n <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        pos, want = self.pos, self.want
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            want[i] += self.dwant[i]
+
+        for i in (1, 2, 3):
+            d = want[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = self._parabolic(i, d)
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = qp
+                pos[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.pos
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if not self.q:
+            return None
+        if self.n <= 5:
+            # Exact quantile of the few samples seen so far
+            return self.q[min(len(self.q) - 1, int(self.p * len(self.q)))]
+        return self.q[2]
+
+    @property
+    def min(self):
+        return self.q[0] if self.q else None
+
+    @property
+    def max(self):
+        return self.q[-1] if self.q else None
+
+
+class QuantileSketch:
+    """Several P^2 estimators over the same stream, for a piecewise-linear CDF"""
+    __slots__ = ('n', 'estimators')
+
+    def __init__(self, quantiles=QUANTILES):
+        self.n = 0
+        self.estimators = [P2Quantile(p) for p in quantiles]
+
+    def add(self, x):
+        self.n += 1
+        for e in self.estimators:
+            e.add(x)
+
+    def quantile(self, p):
+        """Estimate of quantile p (must be one of the tracked quantiles)"""
+        for e in self.estimators:
+            if e.p == p:
+                return e.value()
+        raise KeyError(f"quantile {p} is not tracked")
+
+    def cdf(self, x):
+        """Estimated fraction of the stream <= x"""
+        first = self.estimators[0]
+        points = [(first.min, 0.0)]
+        points += [(e.value(), e.p) for e in self.estimators]
+        points.append((first.max, 1.0))
+        if x <= points[0][0]:
+            return 0.0
+        for (x0, p0), (x1, p1) in zip(points, points[1:]):
+            if x <= x1:
+                return p1 if x1 <= x0 else p0 + (p1 - p0) * (x - x0) / (x1 - x0)
+        return 1.0
+
+
+class ScoreCalibrator:
+    """
+    Per-key adaptive thresholds for anomaly scores (higher = more anomalous).
+    Until a key has seen `warmup` scores, the model's own threshold is used.
+    """
+
+    def __init__(self, contamination=0.1, warmup=100, window=10000):
+        self.target = 1 - contamination
+        if self.target not in QUANTILES:
+            raise ValueError(f"contamination must be one of {[round(1 - q, 2) for q in QUANTILES]}")
+        self.warmup = warmup
+        self.window = window
+        self.current = {}
+        self.previous = {}
+
+    def _sketch(self, key):
+        """The sketch to read for key: the current window once warm, else the previous one"""
+        cur = self.current.get(key)
+        if cur is not None and cur.n >= self.warmup:
+            return cur
+        prev = self.previous.get(key)
+        if prev is not None and prev.n >= self.warmup:
+            return prev
+        return None
+
+    def update(self, key, score):
+        cur = self.current.get(key)
+        if cur is None:
+            cur = self.current[key] = QuantileSketch()
+        cur.add(score)
+        if cur.n >= self.window:
+            self.previous[key] = cur
+            self.current[key] = QuantileSketch()
+
+    def threshold(self, key, default):
+        sketch = self._sketch(key)
+        return default if sketch is None else sketch.quantile(self.target)
+
+    def percentile(self, key, score):
+        """Calibrated score: estimated fraction of recent scores for key <= score (None while warming up)"""
+        sketch = self._sketch(key)
+        return None if sketch is None else sketch.cdf(score)
+
+    def thresholds(self):
+        """Current adaptive threshold for every warm key"""
+        out = {}
+        for key in set(self.current) | set(self.previous):
+            sketch = self._sketch(key)
+            if sketch is not None:
+                out[key] = sketch.quantile(self.target)
+        return out
@@ -0,0 +1,195 @@
+# dns.py - DNS layer of the detection engine: features from raw domain names
+# and the DNS Isolation Forest
+#
+# The training code isn't in this repo; the definitions below are the ones
+# the pickle's own split thresholds agree with (StrangeCharacters splits run
+# from 0 to ~32 with a median of ~2.3, SpecialCharRatio from 0 to ~0.17):
+#   Entropy           - Shannon entropy (bits) of the domain's characters
+#   DomainLength      - number of characters in the domain
+#   StrangeCharacters - characters that are not letters, dots or hyphens
+#                       (digits and anything unusual)
+#   SpecialCharRatio  - characters that are neither alphanumeric nor dots
+#                       (hyphens, underscores, ...) / DomainLength
+# check_reference_domains() scores a few well-known domains through this
+# extractor; the raw-domain paths refuse to run if any comes out wrong.
+
+from collections import OrderedDict
+import os
+import threading
+
+import joblib
+import numpy as np
+
+from .model import ROOT_DIR
+
+DNS_MODEL_PATH = os.path.join(ROOT_DIR, 'backend', 'isolation_forest_dns_public.pkl')
+
+DNS_FEATURES = ['Entropy', 'DomainLength', 'StrangeCharacters', 'SpecialCharRatio']
+
+CACHE_SIZE = 65536
+
+# Byte-class lookup tables (256 entries, indexed by byte value)
+_LETTER = np.zeros(256, dtype=np.float64)
+for _c in b'abcdefghijklmnopqrstuvwxyz':
+    _LETTER[_c] = 1.0
+_STRANGE = 1.0 - _LETTER
+_STRANGE[ord('.')] = 0.0
+_STRANGE[ord('-')] = 0.0
+_SPECIAL = 1.0 - _LETTER
+for _c in b'0123456789.':
+    _SPECIAL[_c] = 0.0
+# Byte 0 is the padding value, never part of a domain
+_STRANGE[0] = 0.0
+_SPECIAL[0] = 0.0
+
+_cache = OrderedDict()
+_score_cache = OrderedDict()    # normalized domain -> decision_function value
+_cache_lock = threading.Lock()  # ensemble detectors score from several threads
+
+
+def normalize_domain(domain):
+    """Lowercase and strip the trailing root dot (e.g. 'Example.COM.' -> 'example.com')"""
+    return domain.strip().lower().rstrip('.')
+
+
+def _compute(domains):
+    """
+    Vectorized feature pass over a list of normalized domains
+    Returns: float64 array of shape (len(domains), len(DNS_FEATURES))
+    """
+    n = len(domains)
+    out = np.zeros((n, len(DNS_FEATURES)), dtype=np.float64)
+    if n == 0:
+        return out
+
+    encoded = [d.encode('utf-8', 'replace') for d in domains]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=n)
+    width = int(lengths.max()) if n else 0
+    if width == 0:
+        return out
+
+    # Pack all domains into one zero-padded (n, width) byte matrix
+    buf = np.frombuffer(b''.join(b.ljust(width, b'\0') for b in encoded), dtype=np.uint8)
+    buf = buf.reshape(n, width)
+
+    # Per-row 256-bin byte histogram in a single bincount
+    offsets = (np.arange(n, dtype=np.int64) * 256)[:, None]
+    hist = np.bincount((buf + offsets).ravel(), minlength=n * 256).reshape(n, 256)
+    hist[:, 0] = 0
+    hist = hist.astype(np.float64)
+
+    safe_len = np.maximum(lengths, 1).astype(np.float64)
+    p = hist / safe_len[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logp = np.where(p > 0, np.log2(p), 0.0)
+    out[:, 0] = -(p * logp).sum(axis=1) + 0.0  # avoid -0.0 for empty rows
+    out[:, 1] = lengths
+    out[:, 2] = hist @ _STRANGE
+    out[:, 3] = (hist @ _SPECIAL) / safe_len
+    out[lengths == 0, 3] = 0.0
+    return out
+
+
+def extract_dns_features(domains):
+    """
+    Compute DNS_FEATURES for many domains at once, using the per-domain LRU cache
+    Returns: float64 array of shape (len(domains), len(DNS_FEATURES)), rows in input order
+    """
+    names = [normalize_domain(d) for d in domains]
+    out = np.empty((len(names), len(DNS_FEATURES)), dtype=np.float64)
+
+    missing = _lookup(_cache, names, out)
+    if missing:
+        unique = list(missing)
+        computed = _compute(unique)
+        _store(_cache, unique, computed, missing, out)
+    return out
+
+
+def _lookup(cache, names, out):
+    """Fill out[i] from cache for every cached name. Returns: {missing name: [rows]}"""
+    missing = {}
+    with _cache_lock:
+        for i, name in enumerate(names):
+            value = cache.get(name)
+            if value is None:
+                missing.setdefault(name, []).append(i)
+            else:
+                cache.move_to_end(name)
+                out[i] = value
+    return missing
+
+
+def _store(cache, unique, values, missing, out):
+    with _cache_lock:
+        for name, value in zip(unique, values):
+            out[missing[name]] = value
+            cache[name] = value
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+_dns_model = None
+
+
+def load_dns_model():
+    """Load the DNS Isolation Forest once per process"""
+    global _dns_model
+    if _dns_model is None:
+        _dns_model = joblib.load(DNS_MODEL_PATH)
+    return _dns_model
+
+
+# Known domains and whether the model should flag them, scored from their names
+REFERENCE_DOMAINS = {
+    'google.com': False,
+    'amazon.com': False,
+    'github.com': False,
+    'en.wikipedia.org': False,
+    'microsoft.com': False,
+    'zoom.us': False,
+    'xj3k2l9qpz.top': True,
+    'a1b2c3d4e5f6g7h8.info': True,
+    'kq8w7e6r5t4y3u2i1o.ru': True,
+}
+
+
+def check_reference_domains():
+    """
+    Score REFERENCE_DOMAINS through extract_dns_features and the model
+    Returns: list of domains whose verdict is wrong (empty when the features match)
+    """
+    domains = list(REFERENCE_DOMAINS)
+    results = detect_dns_anomalies(extract_dns_features(domains))
+    return [d for d, r in zip(domains, results) if r['is_anomaly'] != REFERENCE_DOMAINS[d]]
+
+
+def dns_scores(domains):
+    """
+    Model decision_function for many domains, cached per normalized domain
+    next to the feature cache (a host's score never changes for a loaded model)
+    Returns: float64 array in input order (negative = anomalous)
+    """
+    names = [normalize_domain(d) for d in domains]
+    out = np.empty(len(names), dtype=np.float64)
+    missing = _lookup(_score_cache, names, out)
+    if missing:
+        unique = list(missing)
+        computed = load_dns_model().decision_function(extract_dns_features(unique))
+        _store(_score_cache, unique, computed, missing, out)
+    return out
+
+
+def detect_dns_anomalies(X):
+    """
+    Score a (n, len(DNS_FEATURES)) feature matrix in one model call
+    Returns: list of {'is_anomaly': bool, 'anomaly_score': float}
+    """
+    if len(X) == 0:
+        return []
+    scores = load_dns_model().decision_function(X)
+    # IsolationForest.predict is decision_function < 0, so derive it instead of a second pass
+    return [
+        {'is_anomaly': bool(s < 0), 'anomaly_score': float(s)}
+        for s in scores
+    ]
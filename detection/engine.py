@@ -0,0 +1,146 @@
+# engine.py - Single entry point for permission threat scoring
+#
+# score(events) is used by main.py (extension API), backend/main.py
+# (hybrid_threat_detection for the local monitor) and any batch tools, so
+# every caller gets the same verdict for the same event.
+#
+# The ML layer's threshold is calibrated online: each permission type keeps a
+# streaming quantile sketch of its recent anomaly scores, and an event is
+# anomalous when its score is above that type's (1 - contamination) quantile.
+# Until a type has enough history the forest's own threshold is used.
+
+import threading
+
+import numpy as np
+
+from .calibration import ScoreCalibrator
+from .ensemble import event_host
+from .model import load_permission_model
+from .rules import check_normalized, normalize_app, normalize_permission
+
+# Expected share of anomalous events per permission type
+CONTAMINATION = 0.1
+calibrator = ScoreCalibrator(contamination=CONTAMINATION)
+# The APIs score from worker threads; P^2 updates are not atomic
+calibration_lock = threading.Lock()
+
+
+def _field(event, name):
+    return event[name] if isinstance(event, dict) else getattr(event, name)
+
+
+def calibration_key(model, perm):
+    """Calibration is per permission the model knows, plus one bucket for the rest"""
+    return perm if perm in model.perm_index else '*'
+
+
+def score(events, calibrate=True, ensemble=None):
+    """
+    Score a batch of events. Each event is a dict (or object) with
+    app_name, permission_type, hour and optionally url. With calibrate=False
+    the forest's fixed threshold is used and the calibration state is left
+    untouched. With an ensemble (detection.ensemble.Ensemble) the ML layer's
+    verdict is the ensemble's combined score instead of the forest alone.
+    Returns: list of verdict dicts, in input order:
+        threat_level      - LOW / MEDIUM / HIGH / CRITICAL
+        reason            - human readable explanation
+        layers_triggered  - ["Rule-Based"], ["ML-Behavioral"], ["ML-Ensemble"] or []
+        anomaly_score     - Isolation Forest anomaly score in (0, 1], None without a model
+        threshold         - anomaly_score threshold applied to this event
+        decision_score    - threshold - anomaly_score (negative = anomalous)
+        calibrated_score  - share of recent scores for this permission <= anomaly_score,
+                            None until the permission has enough history
+        ml_anomaly        - bool, anomaly_score > threshold (or the ensemble's verdict)
+        ensemble          - only with an ensemble: {'score', 'detectors': {name: score}}
+    """
+    events = list(events)
+    apps = [normalize_app(_field(e, 'app_name')) for e in events]
+    perms = [normalize_permission(_field(e, 'permission_type')) for e in events]
+    hours = [int(_field(e, 'hour')) for e in events]
+
+    combined = None
+    if ensemble is not None and events:
+        batch = {'apps': apps, 'perms': perms, 'hours': hours,
+                 'hosts': [event_host(e, _field(e, 'app_name')) for e in events]}
+        combined, per_detector, _ = ensemble.run(batch)
+
+    # Layer 2 runs for the whole batch in one vectorized lookup
+    model = load_permission_model()
+    if model is not None and events:
+        idx = [model.indices(a, p) for a, p in zip(apps, perms)]
+        app_idx = np.fromiter((i for i, _ in idx), dtype=np.int64, count=len(idx))
+        perm_idx = np.fromiter((j for _, j in idx), dtype=np.int64, count=len(idx))
+        scores = model.anomaly_scores(app_idx, perm_idx, hours).tolist()
+    else:
+        scores = [None] * len(events)
+
+    verdicts = []
+    for i, (app, perm, hour, s) in enumerate(zip(apps, perms, hours, scores)):
+        threshold = calibrated = None
+        if s is not None:
+            if calibrate:
+                key = calibration_key(model, perm)
+                with calibration_lock:
+                    threshold = calibrator.threshold(key, model.threshold)
+                    calibrated = calibrator.percentile(key, s)
+                    calibrator.update(key, s)
+            else:
+                threshold = model.threshold
+        ml_anomaly = s is not None and s > threshold
+        if combined is not None:
+            ml_anomaly = bool(combined[i] > ensemble.threshold)
+
+        # Layer 1: rules take precedence over the model
+        is_threat, level, reason = check_normalized(app, perm, hour)
+        if is_threat:
+            layers = ["Rule-Based"]
+        elif ml_anomaly:
+            level, reason = "MEDIUM", "Machine learning detected unusual behavior pattern"
+            layers = ["ML-Ensemble"] if combined is not None else ["ML-Behavioral"]
+        else:
+            level, reason, layers = "LOW", "Normal activity", []
+
+        verdict = {
+            'threat_level': level,
+            'reason': reason,
+            'layers_triggered': layers,
+            'anomaly_score': s,
+            'threshold': threshold,
+            'decision_score': None if s is None else threshold - s,
+            'calibrated_score': calibrated,
+            'ml_anomaly': ml_anomaly,
+        }
+        if combined is not None:
+            verdict['ensemble'] = {
+                'score': _finite(combined[i]),
+                'detectors': {name: _finite(v[i]) for name, v in per_detector.items()},
+            }
+        verdicts.append(verdict)
+
+    if combined is not None:
+        ensemble.observe(batch)
+    return verdicts
+
+
+def _finite(x):
+    """NaN (detector abstained) -> None, for JSON"""
+    x = float(x)
+    return None if x != x else x
+
+
+def hybrid_threat_detection(app_name, permission, hour, calibrate=True):
+    """
+    Combines rule-based + ML detection for a single event
+    Returns: (threat_level, reason, layers_triggered)
+    """
+    v = score([{'app_name': app_name, 'permission_type': permission, 'hour': hour}], calibrate)[0]
+    return v['threat_level'], v['reason'], v['layers_triggered']
+
+
+def predict_anomaly(app_name, permission, hour, calibrate=True):
+    """
+    ML-based anomaly detection using Isolation Forest
+    Returns: 1 for anomaly, 0 for normal
+    """
+    v = score([{'app_name': app_name, 'permission_type': permission, 'hour': hour}], calibrate)[0]
+    return 1 if v['ml_anomaly'] else 0
@@ -0,0 +1,251 @@
+# ensemble.py - Several ML detectors scored concurrently and combined
+#
+# Each detector scores the whole batch and returns one value per event in
+# [0, 1], with 0.5 at its own decision boundary (above = anomalous), or NaN
+# where it has no opinion (e.g. the DNS model for an event without a
+# hostname). Detectors run in parallel on a thread pool, so a batch costs
+# about as much as the slowest detector rather than the sum of all of them;
+# NumPy and scikit-learn release the GIL for most of their work. The
+# combined score is the weighted mean of the detectors that had an opinion.
+#
+# Detectors:
+#   forest    - the permission Isolation Forest (compiled table)
+#   frequency - how rarely this app has used this permission so far
+#   dns       - the DNS Isolation Forest on the origin's hostname
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import os
+import threading
+import time
+
+import numpy as np
+
+from .dns import check_reference_domains, dns_scores
+from .events import EventBatch
+from .model import load_permission_model
+from .rules import normalize_app, normalize_permission
+
+DEFAULT_WEIGHTS = {'forest': 1.0, 'frequency': 0.5, 'dns': 1.0}
+
+
+def event_host(event, app_name):
+    """
+    Hostname an event came from: its url if it has one, else app_name for
+    DNS events (dns_tail logs the queried domain as the app). Process names
+    are never taken for hosts, dotted or not (python3.11, org.gnome.Shell).
+    Returns: hostname or None
+    """
+    def field(name):
+        return event.get(name) if isinstance(event, dict) else getattr(event, name, None)
+
+    url = field('url')
+    if url:
+        return urlsplit(url).hostname
+    if normalize_permission(field('permission_type') or '') == 'dns':
+        return app_name.strip().lower() or None
+    return None
+
+
+# ============================================
+# DETECTORS
+# ============================================
+class ForestDetector:
+    """Permission Isolation Forest, rescaled so its threshold maps to 0.5"""
+    name = 'forest'
+
+    def __init__(self, model):
+        self.model = model
+
+    def score(self, batch):
+        m = self.model
+        idx = [m.indices(a, p) for a, p in zip(batch['apps'], batch['perms'])]
+        s = m.anomaly_scores([i for i, _ in idx], [j for _, j in idx], batch['hours'])
+        t = m.threshold
+        return np.where(s <= t, 0.5 * s / t, 0.5 + 0.5 * (s - t) / (1 - t))
+
+
+class FrequencyDetector:
+    """
+    Rarity of (app, permission) among the events seen so far for that app.
+    p = P(permission | app) with add-one smoothing; a permission this app
+    uses less than min_share of the time is past the boundary. Abstains for
+    apps with fewer than min_count events.
+    """
+    name = 'frequency'
+
+    def __init__(self, min_count=20, min_share=0.05):
+        self.min_count = min_count
+        self.min_share = min_share
+        self.lock = threading.Lock()
+        self.app_counts = {}
+        self.pair_counts = {}
+        self.perms = set()
+
+    def observe(self, apps, perms):
+        with self.lock:
+            for app, perm in zip(apps, perms):
+                self.app_counts[app] = self.app_counts.get(app, 0) + 1
+                self.pair_counts[(app, perm)] = self.pair_counts.get((app, perm), 0) + 1
+                self.perms.add(perm)
+
+    def score(self, batch):
+        out = np.full(len(batch['apps']), np.nan)
+        with self.lock:
+            k = len(self.perms) + 1
+            for i, (app, perm) in enumerate(zip(batch['apps'], batch['perms'])):
+                n = self.app_counts.get(app, 0)
+                if n >= self.min_count:
+                    out[i] = (self.pair_counts.get((app, perm), 0) + 1) / (n + k)
+        m = self.min_share
+        with np.errstate(invalid='ignore'):
+            return np.where(out < m, 0.5 + 0.5 * (m - out) / m, 0.5 * (1 - out) / (1 - m))
+
+
+class DnsDetector:
+    """DNS Isolation Forest on the origin hostname (decision_function 0 -> 0.5), cached per host"""
+    name = 'dns'
+
+    def score(self, batch):
+        out = np.full(len(batch['hosts']), np.nan)
+        rows = [i for i, h in enumerate(batch['hosts']) if h]
+        if rows:
+            out[rows] = np.clip(0.5 - dns_scores([batch['hosts'][i] for i in rows]), 0.0, 1.0)
+        return out
+
+
+# ============================================
+# ENSEMBLE
+# ============================================
+class Ensemble:
+    def __init__(self, detectors, weights=None, threshold=0.5):
+        self.detectors = detectors
+        self.weights = {d.name: (weights or DEFAULT_WEIGHTS).get(d.name, 1.0) for d in detectors}
+        self.threshold = threshold
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(detectors)), thread_name_prefix='ensemble')
+        self.lock = threading.Lock()
+        self.totals = {d.name: {'batches': 0, 'events': 0, 'seconds': 0.0, 'contribution': 0.0}
+                       for d in detectors}
+
+    @staticmethod
+    def _timed(detector, batch):
+        start = time.perf_counter()
+        scores = detector.score(batch)
+        return scores, time.perf_counter() - start
+
+    def run(self, batch):
+        """
+        Score a batch (dict of equal-length lists: apps, perms, hours, hosts)
+        Returns: (combined scores array, {detector: scores array}, {detector: seconds})
+        """
+        n = len(batch['apps'])
+        futures = {d.name: self.pool.submit(self._timed, d, batch) for d in self.detectors}
+        per_detector, timings = {}, {}
+        for name, future in futures.items():
+            try:
+                scores, seconds = future.result()
+            except Exception as e:
+                print(f"⚠️ Ensemble detector {name} failed: {e}")
+                scores, seconds = np.full(n, np.nan), 0.0
+            per_detector[name] = np.asarray(scores, dtype=np.float64)
+            timings[name] = seconds
+
+        weighted = np.zeros(n)
+        total_weight = np.zeros(n)
+        for name, scores in per_detector.items():
+            has = ~np.isnan(scores)
+            weighted[has] += self.weights[name] * scores[has]
+            total_weight[has] += self.weights[name]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            combined = np.where(total_weight > 0, weighted / total_weight, np.nan)
+
+        with self.lock:
+            for name, scores in per_detector.items():
+                t = self.totals[name]
+                t['batches'] += 1
+                t['events'] += n
+                t['seconds'] += timings[name]
+                has = ~np.isnan(scores) & (total_weight > 0)
+                t['contribution'] += float(np.sum(self.weights[name] * scores[has] / total_weight[has]))
+        return combined, per_detector, timings
+
+    def observe(self, batch):
+        """Let online detectors learn from a scored batch"""
+        for d in self.detectors:
+            if hasattr(d, 'observe'):
+                d.observe(batch['apps'], batch['perms'])
+
+    def stats(self):
+        """Per detector: weight, calls, mean ms per batch, mean share of the combined score"""
+        with self.lock:
+            return {
+                name: {
+                    'weight': self.weights[name],
+                    'batches': t['batches'],
+                    'mean_ms': 1000 * t['seconds'] / t['batches'] if t['batches'] else 0.0,
+                    'mean_contribution': t['contribution'] / t['events'] if t['events'] else 0.0,
+                }
+                for name, t in self.totals.items()
+            }
+
+
+def parse_weights(spec):
+    """'forest=1,dns=0.5' -> {'forest': 1.0, 'dns': 0.5}"""
+    weights = {}
+    for part in spec.split(','):
+        if part.strip():
+            name, _, value = part.partition('=')
+            weights[name.strip()] = float(value) if value else 1.0
+    return weights
+
+
+def build_ensemble(weights=None, history=None):
+    """
+    Create an Ensemble of the detectors that can be loaded. weights picks the
+    detectors (name -> weight; zero-weight detectors are left out); history
+    is an optional EventBatch to seed the frequency detector with.
+    Returns: Ensemble, or None if no detector could be loaded
+    """
+    weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+    detectors = []
+    if weights.get('forest'):
+        model = load_permission_model()
+        if model is not None:
+            detectors.append(ForestDetector(model))
+    if weights.get('frequency'):
+        frequency = FrequencyDetector()
+        if history is not None and len(history):
+            apps = [normalize_app(a) for a in history.apps]
+            perms = [normalize_permission(p) for p in history.perms]
+            frequency.observe([apps[i] for i in history.arrays['app'].tolist()],
+                              [perms[i] for i in history.arrays['perm'].tolist()])
+        detectors.append(frequency)
+    if weights.get('dns'):
+        try:
+            wrong = check_reference_domains()
+            if wrong:
+                print(f"⚠️ DNS detector not loaded: features disagree with the model on {', '.join(wrong)}")
+            else:
+                detectors.append(DnsDetector())
+        except Exception as e:
+            print(f"⚠️ DNS detector not loaded: {e}")
+    if not detectors:
+        return None
+    print(f"🧩 Ensemble: {', '.join(f'{d.name}={weights[d.name]:g}' for d in detectors)}")
+    return Ensemble(detectors, weights)
+
+
+def ensemble_from_env(history_csv=None):
+    """
+    Ensemble configured by PERMISSION_ENSEMBLE (e.g. 'forest=1,frequency=0.5,dns=1'
+    or 'on' for the defaults), seeded from an event CSV if given
+    Returns: Ensemble, or None if unset
+    """
+    spec = os.environ.get('PERMISSION_ENSEMBLE', '').strip()
+    if not spec:
+        return None
+    weights = DEFAULT_WEIGHTS if spec.lower() in ('1', 'on', 'default') else parse_weights(spec)
+    history = None
+    if history_csv and os.path.exists(history_csv):
+        history = EventBatch.from_csv(history_csv)
+    return build_ensemble(weights, history)
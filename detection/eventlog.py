@@ -0,0 +1,123 @@
+# eventlog.py - Buffered, group-committed writer for the event CSV
+#
+# Rows are serialized into an in-memory buffer and written to the CSV with a
+# single write() + fsync() per commit (a monitor sweep, a DNS batch, or a
+# time interval) on a file descriptor that stays open, instead of an
+# open/write/close per row. A crash can still cut the last commit short, so
+# on startup the log drops a trailing partial record (no final record end, or
+# a last record with the wrong number of fields) before appending to the file.
+# Record ends are found by quote parity, so a committed row whose field holds
+# a newline is not mistaken for a torn one.
+
+import csv
+import io
+import os
+import re
+import time
+
+from .events import HEADERS
+
+RECOVERY_TAIL = 65536   # bytes inspected at the end of the file on startup
+
+
+class EventLog:
+    def __init__(self, path, commit_interval=0.0):
+        """commit_interval: seconds between commits in maybe_commit(); 0 = every call"""
+        self.path = path
+        self.commit_interval = commit_interval
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+        self.last_commit = time.monotonic()
+        self.recovered_bytes = self.recover()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size == 0:
+            self.writer.writerow(HEADERS)
+            self.commit()
+
+    def recover(self):
+        """
+        Truncate a torn trailing record left by an interrupted commit
+        Returns: number of bytes removed
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        if size == 0:
+            return 0
+        with open(self.path, 'r+b') as f:
+            start = max(0, size - RECOVERY_TAIL)
+            # Quote parity at the start of the tail: csv.writer quotes any field
+            # holding a quote or a newline and doubles inner quotes, so a newline
+            # ends a record only after an even number of quotes
+            quotes = 0
+            while f.tell() < start:
+                quotes += f.read(min(1 << 20, start - f.tell())).count(b'"')
+            tail = f.read()
+            inside = quotes % 2 == 1
+            ends = []
+            for m in re.finditer(rb'["\n]', tail):
+                if m.group() == b'"':
+                    inside = not inside
+                elif not inside:
+                    ends.append(m.end())
+            # Drop everything after the last complete record, then any complete
+            # looking records at the end that don't parse to a full row
+            k = len(ends) - 1
+            while k >= 0:
+                prev = ends[k - 1] if k > 0 else 0
+                if k == 0 and start > 0:
+                    break
+                text = tail[prev:ends[k]].decode('utf-8', 'replace')
+                row = next(csv.reader(io.StringIO(text, newline='')), [])
+                if len(row) == len(HEADERS):
+                    break
+                k -= 1
+            end = ends[k] if k >= 0 else 0
+            removed = len(tail) - end
+            if removed:
+                f.truncate(start + end)
+                f.flush()
+                os.fsync(f.fileno())
+                print(f"🩹 Recovered {self.path}: dropped {removed} bytes of torn trailing record")
+        return removed
+
+    def append(self, event):
+        """Buffer one PermissionEvent (nothing is written until commit)"""
+        self.writer.writerow(event.to_row())
+        self.pending += 1
+
+    def commit(self):
+        """Write every buffered row with one write() and fsync() it. Returns: rows committed"""
+        data = self.buffer.getvalue().encode('utf-8')
+        self.last_commit = time.monotonic()
+        if not data:
+            return 0
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        os.fsync(self.fd)
+        committed = self.pending
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.pending = 0
+        return committed
+
+    def maybe_commit(self):
+        """Commit if commit_interval has passed since the last commit"""
+        if time.monotonic() - self.last_commit >= self.commit_interval:
+            return self.commit()
+        return 0
+
+    def close(self):
+        if self.fd is not None:
+            self.commit()
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,241 @@
+# events.py - Compact event records shared by the monitor, the engine and the APIs
+#
+# PermissionEvent is a slotted record for single events (no per-instance
+# __dict__). EventBatch is the struct-of-arrays form for many events: the
+# repetitive string columns (app, permission, level, reason, layers) are
+# interned to small integer codes held in NumPy arrays, so filtering and
+# counting are array operations and strings are only rebuilt for the rows a
+# response actually returns. Threat levels outside LEVELS keep their own
+# string (they get codes after the four known levels) instead of being
+# counted as LOW.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+HEADERS = ['timestamp', 'app_name', 'permission_type', 'threat_level', 'reason', 'layers_triggered', 'hour']
+LEVELS = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
+
+def dumps(obj):
+    """Serialize to JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':'), default=_json_default).encode()
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class PermissionEvent:
+    """One permission event, one CSV row (pid, when a sensor knows it, is not logged)"""
+    __slots__ = tuple(HEADERS) + ('pid',)
+
+    def __init__(self, timestamp, app_name, permission_type, threat_level='LOW', reason='',
+                 layers_triggered='', hour=0, pid=None):
+        self.timestamp = timestamp
+        self.app_name = app_name
+        self.permission_type = permission_type
+        self.threat_level = threat_level
+        self.reason = reason
+        self.layers_triggered = layers_triggered
+        self.hour = hour
+        self.pid = pid
+
+    def apply_verdict(self, verdict):
+        """Copy a detection.score() verdict onto the event. Returns: self"""
+        self.threat_level = verdict['threat_level']
+        self.reason = verdict['reason']
+        self.layers_triggered = ','.join(verdict['layers_triggered'])
+        return self
+
+    def to_row(self):
+        return [self.timestamp, self.app_name, self.permission_type, self.threat_level,
+                self.reason, self.layers_triggered, self.hour]
+
+    def to_dict(self):
+        return dict(zip(HEADERS, self.to_row()))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2], row[3], row[4], row[5], int(row[6]))
+
+    def __repr__(self):
+        return f"PermissionEvent({self.app_name!r}, {self.permission_type!r}, {self.threat_level!r})"
+
+
+class _Interner:
+    __slots__ = ('codes', 'values')
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value):
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+
+class EventBatch:
+    """Struct-of-arrays view of many events with interned string columns"""
+
+    def __init__(self):
+        self.timestamps = []
+        self._apps = _Interner()
+        self._perms = _Interner()
+        self._levels = _Interner(LEVELS)
+        self._reasons = _Interner()
+        self._layers = _Interner()
+        self._cols = {'app': [], 'perm': [], 'level': [], 'reason': [], 'layers': [], 'hour': []}
+        self._arrays = None
+
+    # ============================================
+    # BUILDING
+    # ============================================
+    def append_row(self, row):
+        """Append one CSV row (list of strings in HEADERS order)"""
+        hour = int(row[6]) if row[6] else 0
+        if self._cols is None:
+            # Built by from_csv: go back to growable lists
+            self._cols = {k: v.tolist() for k, v in self._arrays.items()}
+            self.timestamps = list(self.timestamps)
+        cols = self._cols
+        self.timestamps.append(row[0])
+        cols['app'].append(self._apps.code(row[1]))
+        cols['perm'].append(self._perms.code(row[2]))
+        cols['level'].append(self._levels.code(row[3]))
+        cols['reason'].append(self._reasons.code(row[4]))
+        cols['layers'].append(self._layers.code(row[5]))
+        cols['hour'].append(hour)
+        self._arrays = None
+
+    def append(self, event):
+        self.append_row(event.to_row())
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Read an event CSV (with header) into a batch, with pandas' C parser
+        and one factorize() per string column. Skips a torn trailing row left
+        by an interrupted write, rows with extra fields, and rows whose hour
+        isn't an integer (a blank hour counts as 0).
+        """
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return cls()
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b'\n'
+        df = pd.read_csv(path, dtype={h: object for h in HEADERS[:-1]}, na_filter=False,
+                         on_bad_lines='skip')
+        if torn and len(df):
+            df = df.iloc[:-1]
+        hours = df['hour']
+        if not pd.api.types.is_integer_dtype(hours):
+            # The torn row (now dropped) or blank / bad hours made it a string column
+            hours = hours.where(hours != '', '0')
+            try:
+                hours = hours.astype(np.int64)
+            except (TypeError, ValueError):
+                hours = pd.to_numeric(hours, errors='coerce')
+                keep = hours.notna() & (hours == hours.round())
+                df, hours = df[keep], hours[keep]
+
+        batch = cls()
+        batch.timestamps = df['timestamp'].to_numpy(dtype=object)
+        arrays = {}
+        for key, column, interner, dtype in (('app', 'app_name', batch._apps, np.int32),
+                                             ('perm', 'permission_type', batch._perms, np.int32),
+                                             ('level', 'threat_level', batch._levels, np.int16),
+                                             ('reason', 'reason', batch._reasons, np.int32),
+                                             ('layers', 'layers_triggered', batch._layers, np.int32)):
+            codes, uniques = pd.factorize(df[column])
+            remap = np.fromiter((interner.code(v) for v in uniques), dtype=np.int64, count=len(uniques))
+            arrays[key] = remap[codes].astype(dtype) if len(codes) else np.zeros(0, dtype=dtype)
+        arrays['hour'] = hours.to_numpy(dtype=np.int8)
+        batch._arrays = arrays
+        batch._cols = None
+        return batch
+
+    # ============================================
+    # COLUMNS
+    # ============================================
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def arrays(self):
+        """Code columns as NumPy arrays (built lazily, cached until the next append)"""
+        if self._arrays is None:
+            cols = self._cols
+            self._arrays = {
+                'app': np.asarray(cols['app'], dtype=np.int32),
+                'perm': np.asarray(cols['perm'], dtype=np.int32),
+                'level': np.asarray(cols['level'], dtype=np.int16),
+                'reason': np.asarray(cols['reason'], dtype=np.int32),
+                'layers': np.asarray(cols['layers'], dtype=np.int32),
+                'hour': np.asarray(cols['hour'], dtype=np.int8),
+            }
+        return self._arrays
+
+    @property
+    def apps(self):
+        return self._apps.values
+
+    @property
+    def perms(self):
+        return self._perms.values
+
+    def level_mask(self, levels):
+        """Boolean mask of rows whose threat_level is in levels"""
+        codes = [self._levels.codes[level] for level in levels if level in self._levels.codes]
+        return np.isin(self.arrays['level'], codes)
+
+    def app_mask(self, names):
+        """Boolean mask of rows whose app_name is in names"""
+        codes = [self._apps.codes[n] for n in names if n in self._apps.codes]
+        return np.isin(self.arrays['app'], codes)
+
+    def level_counts(self):
+        """Returns: {level: count} for each of LEVELS (rows with other levels aren't counted)"""
+        counts = np.bincount(self.arrays['level'], minlength=len(LEVELS))
+        return {level: int(counts[i]) for i, level in enumerate(LEVELS)}
+
+    # ============================================
+    # OUTPUT
+    # ============================================
+    def records(self, index=None):
+        """
+        Rows as dicts (the shape pandas' to_dict('records') produced), decoding
+        only the selected rows. index: None, slice, or integer/bool array.
+        """
+        a = self.arrays
+        if index is None:
+            index = slice(None)
+        rows = np.arange(len(self))[index]
+        ts = self.timestamps
+        apps = np.asarray(self._apps.values, dtype=object)[a['app'][rows]] if len(rows) else []
+        perms = np.asarray(self._perms.values, dtype=object)[a['perm'][rows]] if len(rows) else []
+        reasons = np.asarray(self._reasons.values, dtype=object)[a['reason'][rows]] if len(rows) else []
+        layers = np.asarray(self._layers.values, dtype=object)[a['layers'][rows]] if len(rows) else []
+        levels = [self._levels.values[c] for c in a['level'][rows].tolist()]
+        hours = a['hour'][rows].tolist()
+        return [
+            {'timestamp': ts[r], 'app_name': app, 'permission_type': perm, 'threat_level': level,
+             'reason': reason, 'layers_triggered': layer, 'hour': hour}
+            for r, app, perm, level, reason, layer, hour
+            in zip(rows.tolist(), apps, perms, levels, reasons, layers, hours)
+        ]
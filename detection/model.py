@@ -0,0 +1,79 @@
+# model.py - Isolation Forest layer of the detection engine
+#
+# The permission model's inputs are one-hot(app_name), one-hot(permission_type)
+# and the hour, so the whole input space is small: (known apps + unknown) x
+# (known permissions + unknown) x 24 hours. PermissionModel scores every
+# combination once at load time and afterwards scoring is a table lookup.
+
+import os
+import joblib
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(ROOT_DIR, 'backend', 'isolation_forest_model.pkl')
+ENCODER_PATH = os.path.join(ROOT_DIR, 'backend', 'onehot_encoder.pkl')
+
+HOURS = 24
+
+
+class PermissionModel:
+    """Isolation Forest + OneHotEncoder compiled into a score lookup table"""
+
+    def __init__(self, model, encoder):
+        self.model = model
+        self.encoder = encoder
+        self.apps = [str(a) for a in encoder.categories_[0]]
+        self.perms = [str(p) for p in encoder.categories_[1]]
+        self.app_index = {a: i for i, a in enumerate(self.apps)}
+        self.perm_index = {p: i for i, p in enumerate(self.perms)}
+        # Anomaly score s = -score_samples, as in the Isolation Forest paper:
+        # close to 1 is anomalous, and s > threshold is what model.predict calls -1
+        self.threshold = float(-model.offset_)
+        self.table = self._build_table()
+
+    def _build_table(self):
+        n_apps = len(self.apps) + 1      # last index = unknown app (all zeros)
+        n_perms = len(self.perms) + 1    # last index = unknown permission
+        a, p, h = np.meshgrid(np.arange(n_apps), np.arange(n_perms), np.arange(HOURS), indexing='ij')
+        a, p, h = a.ravel(), p.ravel(), h.ravel()
+
+        X = np.zeros((len(a), len(self.apps) + len(self.perms) + 1), dtype=np.float64)
+        rows = np.arange(len(a))
+        known_app = a < len(self.apps)
+        X[rows[known_app], a[known_app]] = 1.0
+        known_perm = p < len(self.perms)
+        X[rows[known_perm], len(self.apps) + p[known_perm]] = 1.0
+        X[:, -1] = h
+
+        return (-self.model.score_samples(X)).reshape(n_apps, n_perms, HOURS)
+
+    def indices(self, app, perm):
+        """Table indices for normalized app / permission names"""
+        return (self.app_index.get(app, len(self.apps)),
+                self.perm_index.get(perm, len(self.perms)))
+
+    def anomaly_scores(self, app_idx, perm_idx, hours):
+        """Vectorized lookup. Returns: array of anomaly scores s"""
+        return self.table[app_idx, perm_idx, np.asarray(hours, dtype=np.int64) % HOURS]
+
+
+_model = None
+_loaded = False
+
+
+def load_permission_model():
+    """
+    Load and compile the permission model once per process
+    Returns: PermissionModel, or None if the model files are missing/broken
+    """
+    global _model, _loaded
+    if _loaded:
+        return _model
+    _loaded = True
+    try:
+        _model = PermissionModel(joblib.load(MODEL_PATH), joblib.load(ENCODER_PATH))
+        print(f"🤖 Permission model loaded ({len(_model.apps)} apps, {len(_model.perms)} permissions)")
+    except Exception as e:
+        print(f"⚠️ Permission model not loaded - using rule-based detection only: {e}")
+        _model = None
+    return _model
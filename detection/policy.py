@@ -0,0 +1,132 @@
+# policy.py - Precomputed allow / ask / deny decisions for enforcement
+#
+# The verdict for an event only depends on (app, permission, hour), and the
+# set of apps and permissions the rules and the model distinguish is small,
+# so compile_policy() runs the engine over every combination once and maps
+# each threat level to a decision. Apps and permissions outside those sets
+# share an "unknown" row / column, exactly as they do in score(). Explicit
+# overrides (an origin or app name -> {permission or '*': decision}) take
+# precedence over the table. Consumers look decisions up in-process, so
+# enforcing one adds no network round-trip to the permission prompt.
+
+import base64
+import hashlib
+import json
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from .engine import calibration_key, calibrator, score
+from .model import HOURS, load_permission_model
+from .rules import RULES, normalize_app, normalize_permission
+
+POLICY_SCHEMA = 1
+DECISIONS = ['allow', 'ask', 'deny']
+LEVEL_DECISIONS = {'LOW': 'allow', 'MEDIUM': 'ask', 'HIGH': 'ask', 'CRITICAL': 'deny'}
+
+# Permission names the extension reports that neither rules nor model list
+BROWSER_PERMISSIONS = ['camera', 'microphone', 'camera_microphone', 'location', 'notification']
+
+
+class PolicyTable:
+    def __init__(self, apps, perms, decisions, overrides=None, mode='monitor'):
+        self.apps = apps
+        self.perms = perms
+        self.decisions = decisions      # uint8 (len(apps)+1, len(perms)+1, 24), codes into DECISIONS
+        self.overrides = overrides or {}
+        self.mode = mode
+        self.app_index = {a: i for i, a in enumerate(apps)}
+        self.perm_index = {p: i for i, p in enumerate(perms)}
+
+    def decide(self, app_name, permission, hour):
+        """Returns: 'allow', 'ask' or 'deny'"""
+        app = normalize_app(app_name)
+        perm = normalize_permission(permission)
+        override = self.overrides.get(app)
+        if override is not None:
+            decision = override.get(perm, override.get('*'))
+            if decision is not None:
+                return decision
+        a = self.app_index.get(app, len(self.apps))
+        p = self.perm_index.get(perm, len(self.perms))
+        return DECISIONS[self.decisions[a, p, int(hour) % HOURS]]
+
+    def counts(self):
+        """Returns: {decision: number of table cells}"""
+        counts = np.bincount(self.decisions.ravel(), minlength=len(DECISIONS))
+        return {d: int(counts[i]) for i, d in enumerate(DECISIONS)}
+
+    def to_wire(self):
+        """JSON-ready form for the extension, with a content version for ETags"""
+        body = {
+            'schema': POLICY_SCHEMA,
+            'mode': self.mode,
+            'apps': self.apps,
+            'perms': self.perms,
+            'decisions': base64.b64encode(self.decisions.tobytes()).decode('ascii'),
+            'overrides': self.overrides,
+        }
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+        body['version'] = f"{POLICY_SCHEMA}-{digest}"
+        return body
+
+
+def override_key(name):
+    """'https://zoom.us' -> 'zoom.us' (the extension reports origins by hostname); app names as is"""
+    if '://' in name:
+        host = urlsplit(name.strip()).hostname
+        if not host:
+            raise ValueError(f"{name}: origin has no hostname")
+        return host
+    return normalize_app(name)
+
+
+def load_overrides(path):
+    """
+    Read a JSON file of {"origin or app": {"permission" or "*": "allow|ask|deny"}}
+    Returns: normalized overrides dict
+    """
+    with open(path) as f:
+        raw = json.load(f)
+    overrides = {}
+    for name, perms in raw.items():
+        for perm, decision in perms.items():
+            if decision not in DECISIONS:
+                raise ValueError(f"{name}/{perm}: decision must be one of {DECISIONS}, got {decision!r}")
+            key = perm if perm == '*' else normalize_permission(perm)
+            overrides.setdefault(override_key(name), {})[key] = decision
+    return overrides
+
+
+def compile_policy(overrides=None, mode='monitor'):
+    """
+    Score every (app, permission, hour) the rules and model distinguish and
+    map threat levels to decisions. The ML layer uses the current calibrated
+    thresholds, read without feeding the calibration.
+    Returns: PolicyTable
+    """
+    model = load_permission_model()
+    apps = list(dict.fromkeys((model.apps if model else []) + [a for r in RULES for a in r['apps']]))
+    perms = list(dict.fromkeys((model.perms if model else []) + [p for r in RULES for p in r['perms']]
+                               + BROWSER_PERMISSIONS))
+
+    # '' stands for the unknown app / permission: it matches no rule list and
+    # no model category
+    events = [
+        {'app_name': app, 'permission_type': perm, 'hour': hour}
+        for app in apps + ['']
+        for perm in perms + ['']
+        for hour in range(HOURS)
+    ]
+    levels = []
+    for event, verdict in zip(events, score(events, calibrate=False)):
+        level = verdict['threat_level']
+        if verdict['layers_triggered'] != ["Rule-Based"] and verdict['anomaly_score'] is not None:
+            key = calibration_key(model, normalize_permission(event['permission_type']))
+            anomalous = verdict['anomaly_score'] > calibrator.threshold(key, model.threshold)
+            level = 'MEDIUM' if anomalous else 'LOW'
+        levels.append(DECISIONS.index(LEVEL_DECISIONS[level]))
+
+    decisions = np.asarray(levels, dtype=np.uint8).reshape(len(apps) + 1, len(perms) + 1, HOURS)
+    return PolicyTable(apps, perms, decisions, overrides, mode)
+
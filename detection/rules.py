@@ -0,0 +1,70 @@
+# rules.py - Rule-based layer of the detection engine
+#
+# Rules are plain data so they can be exported to the extension (see
+# main.py:/bundle) and evaluated identically on both sides.
+
+LATE_NIGHT_HOURS = [0, 1, 2, 3, 4, 5]
+
+# Evaluated in order, first match wins.
+#   apps  - normalized app names (lowercase, no .exe); empty matches any app
+#   perms - permission names; a combined permission such as camera_microphone
+#           matches if any of its parts is listed
+#   hours - hours the rule applies to; None means any hour
+RULES = [
+    {'apps': ['calculator', 'notepad', 'wordpad'], 'perms': ['camera', 'microphone'], 'hours': None,
+     'level': 'CRITICAL', 'reason': 'Utility app {app} should never access {perm}'},
+    {'apps': ['cmd', 'powershell'], 'perms': ['camera', 'microphone', 'location'], 'hours': None,
+     'level': 'CRITICAL', 'reason': 'System tool {app} requesting {perm} is highly suspicious'},
+    {'apps': [], 'perms': ['camera', 'microphone'], 'hours': LATE_NIGHT_HOURS,
+     'level': 'HIGH', 'reason': '{Perm} access at {hour}:00 (late night) is unusual'},
+]
+
+
+def normalize_app(app_name):
+    return app_name.lower().replace('.exe', '').strip()
+
+
+def normalize_permission(permission):
+    return permission.lower().strip()
+
+
+def _compile(rules):
+    compiled = []
+    for rule in rules:
+        hours = rule['hours']
+        compiled.append((
+            frozenset(rule['apps']),
+            frozenset(rule['perms']),
+            sum(1 << h for h in hours) if hours is not None else -1,
+            rule['level'],
+            rule['reason'],
+        ))
+    return compiled
+
+
+_COMPILED = _compile(RULES)
+
+
+def check_normalized(app, perm, hour):
+    """
+    Rule check on already-normalized inputs (the engine's hot path)
+    Returns: (is_threat, threat_level, reason)
+    """
+    parts = {perm, *perm.split('_')}
+    hour_bit = 1 << (int(hour) % 24)
+    for apps, perms, hour_mask, level, reason in _COMPILED:
+        if apps and app not in apps:
+            continue
+        if perms and perms.isdisjoint(parts):
+            continue
+        if not hour_mask & hour_bit:
+            continue
+        return True, level, reason.format(app=app, perm=perm, Perm=perm.capitalize(), hour=hour)
+    return False, "LOW", "No rule violations"
+
+
+def rule_based_check(app_name, permission, hour):
+    """
+    Returns: (is_threat, threat_level, reason)
+    """
+    return check_normalized(normalize_app(app_name), normalize_permission(permission), hour)
@@ -0,0 +1,309 @@
+# loadtest.py - Find the saturation point of the permission APIs
+#
+# Replays the traffic the real clients produce:
+#   - extension: the pending/granted PERMISSION_EVENT pair content_injector.js
+#     sends for every getUserMedia/geolocation/notification call, as
+#     POST /check-permission (main.py), for a browser without a scoring bundle
+#   - sync:      a browser with a cached bundle scores locally and sends its
+#     queue as POST /check-permission/batch (SYNC_BATCH_SIZE events each)
+#   - refresh:   its bundle / policy alarms, conditional GET /bundle and
+#     GET /policy (If-None-Match with the last ETag, so mostly 304s)
+#   - monitor:   database.py-style sweeps, a burst of events for every matched
+#     process at once
+#   - dashboard: frontend/index.html polling /apps/simple, plus /events/dashboard
+#     and /stats (backend/app.py)
+#
+# Load is open-loop at --rate requests/s; latency is measured from each
+# request's scheduled send time, so a stalled server shows up as latency
+# instead of silently lowering the offered load. Concurrency (open keep-alive
+# connections) is doubled each stage until the server falls behind the offered
+# load, errors appear, or p99 exceeds the SLO (--scale-rate grows the offered
+# load with concurrency). A request that gets no response within --timeout
+# seconds counts as an error and its connection is dropped.
+#
+# Usage:
+#   python loadtest.py --api http://localhost:8000 --dashboard http://localhost:8001 --rate 500
+#   python loadtest.py --api http://localhost:8000 --rate 500     # extension/monitor traffic only
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# ============================================
+# TRAFFIC GENERATOR (stand-in browser / agent)
+# ============================================
+SITES = ['meet.google.com', 'zoom.us', 'teams.microsoft.com', 'discord.com', 'whereby.com',
+         'maps.google.com', 'weather.com', 'news.example.com', 'xj3k2l9qpz.top', 'calculator.net']
+BROWSER_PERMISSIONS = ['camera', 'microphone', 'camera_microphone', 'location', 'notification']
+MONITOR_APPS = ['Zoom.exe', 'chrome.exe', 'Teams.exe', 'Discord.exe', 'Calculator.exe', 'notepad.exe', 'cmd.exe']
+MONITOR_PERMISSIONS = ['camera', 'microphone', 'location', 'storage']
+DASHBOARD_PATHS = ['/apps/simple', '/apps/simple', '/apps/simple', '/events/dashboard', '/stats']
+SYNC_BATCH_SIZE = 50  # background.js
+LEVELS = ['low', 'medium', 'high', 'critical']
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def browser_events():
+    """One page interaction: the pending event, then the granted/denied one"""
+    site = random.choice(SITES)
+    perm = random.choice(BROWSER_PERMISSIONS)
+    body = {
+        'app_name': site,
+        'permission_type': perm,
+        'timestamp': _now_iso(),
+        'url': f'https://{site}/'
+    }
+    return [body, dict(body, timestamp=_now_iso())]
+
+
+def sweep_events(size):
+    """One database.py sweep: every matched process at the same instant"""
+    ts = _now_iso()
+    return [
+        {'app_name': random.choice(MONITOR_APPS), 'permission_type': random.choice(MONITOR_PERMISSIONS), 'timestamp': ts}
+        for _ in range(size)
+    ]
+
+
+def sync_batch():
+    """One flushSyncQueue() batch: locally scored browser events"""
+    events = []
+    for _ in range(SYNC_BATCH_SIZE // 2):
+        events.extend(dict(body, local_threat_level=random.choice(LEVELS[:2])) for body in browser_events())
+    return {'events': events}
+
+
+def traffic(mix, sweep_size):
+    """Endless stream of (base, method, path, body) following the mix weights"""
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    while True:
+        kind = random.choices(kinds, weights)[0]
+        if kind == 'browser':
+            for body in browser_events():
+                yield 'api', 'POST', '/check-permission', body
+        elif kind == 'sweep':
+            for body in sweep_events(sweep_size):
+                yield 'api', 'POST', '/check-permission', body
+        elif kind == 'sync':
+            yield 'api', 'POST', '/check-permission/batch', sync_batch()
+        elif kind == 'refresh':
+            yield 'api', 'GET', '/bundle', None
+            yield 'api', 'GET', '/policy', None
+        else:
+            yield 'dashboard', 'GET', random.choice(DASHBOARD_PATHS), None
+
+
+# ============================================
+# MINIMAL ASYNCIO HTTP/1.1 CLIENT (keep-alive)
+# ============================================
+class Connection:
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = None
+        self.writer = None
+        self.etags = {}     # path -> last ETag, sent back as If-None-Match like a browser
+
+    async def request(self, method, path, body=None):
+        """Returns: HTTP status code"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b''
+        etag = self.etags.get(path) if method == 'GET' else None
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                + (f"If-None-Match: {etag}\r\n" if etag else "")
+                + f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n")
+        self.writer.write(head.encode() + payload)
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'etag':
+                self.etags[path] = value.strip()
+            value = value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding' and 'chunked' in value:
+                chunked = True
+            elif name == 'connection' and value == 'close':
+                close = True
+
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+# ============================================
+# STAGE RUNNER
+# ============================================
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_stage(bases, concurrency, rate, duration, stream, timeout):
+    """Offer `rate` req/s over `concurrency` connections for `duration` seconds"""
+    start = time.perf_counter() + 0.05
+    total = int(rate * duration)
+    next_index = 0
+    latencies = []
+    errors = 0
+    statuses = {}
+
+    async def worker():
+        nonlocal next_index, errors
+        conns = {name: Connection(url) for name, url in bases.items()}
+        while True:
+            i = next_index
+            if i >= total:
+                break
+            next_index += 1
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            base, method, path, body = next(stream)
+            conn = conns[base]
+            try:
+                status = await asyncio.wait_for(conn.request(method, path, body), timeout)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status >= 400:
+                    errors += 1
+            except asyncio.TimeoutError:
+                # The response may still arrive; the connection can't be reused
+                conn.close()
+                errors += 1
+                statuses['timeout'] = statuses.get('timeout', 0) + 1
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                conn.close()
+                errors += 1
+                statuses['conn'] = statuses.get('conn', 0) + 1
+            latencies.append(time.perf_counter() - scheduled)
+        for conn in conns.values():
+            conn.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    latencies.sort()
+    done = len(latencies)
+    return {
+        'concurrency': concurrency,
+        'offered_rps': rate,
+        'throughput_rps': (done - errors) / elapsed,
+        'error_rate': errors / done if done else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        'statuses': statuses,
+    }
+
+
+def saturated(cur, max_error_rate, slo_ms):
+    """Returns: reason string if cur is past the saturation point, else None"""
+    if cur['error_rate'] > max_error_rate:
+        return f"error rate {cur['error_rate']:.1%} > {max_error_rate:.1%}"
+    if cur['p99_ms'] > slo_ms:
+        return f"p99 {cur['p99_ms']:.0f}ms > SLO {slo_ms:.0f}ms"
+    if cur['throughput_rps'] < cur['offered_rps'] * 0.95:
+        return f"sustained {cur['throughput_rps']:.0f} req/s of {cur['offered_rps']:.0f} offered"
+    return None
+
+
+async def main(args):
+    # main.py and backend/app.py are separate servers (both default to port
+    # 8000), so dashboard paths only go out when the dashboard URL is given
+    bases = {'api': args.api}
+    mix = {'browser': args.browser_weight, 'sync': args.sync_weight,
+           'refresh': args.refresh_weight, 'sweep': args.sweep_weight}
+    mix = {kind: weight for kind, weight in mix.items() if weight > 0}
+    if args.dashboard and args.dashboard_weight > 0:
+        bases['dashboard'] = args.dashboard
+        mix['dashboard'] = args.dashboard_weight
+    stream = traffic(mix, args.sweep_size)
+
+    print("=" * 92)
+    print(f"🚦 Load test: {args.rate} req/s offered, {args.duration}s per stage")
+    print(f"   API: {bases['api']}   Dashboard: {bases.get('dashboard', 'not tested (no --dashboard)')}   Mix: {mix}")
+    print("=" * 92)
+    print(f"{'conc':>5} {'offered':>8} {'thruput':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+
+    results = []
+    concurrency = args.start_concurrency
+    while concurrency <= args.max_concurrency:
+        rate = args.rate * (concurrency / args.start_concurrency if args.scale_rate else 1)
+        r = await run_stage(bases, concurrency, rate, args.duration, stream, args.timeout)
+        results.append(r)
+        print(f"{r['concurrency']:>5} {r['offered_rps']:>8.0f} {r['throughput_rps']:>8.1f} {r['error_rate']:>7.1%} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+
+        reason = saturated(r, args.max_error_rate, args.slo_ms)
+        if reason:
+            best = max(results, key=lambda x: x['throughput_rps'])
+            print(f"\n🔴 Saturated at concurrency {concurrency}: {reason}")
+            print(f"   Peak sustained throughput: {best['throughput_rps']:.1f} req/s at concurrency {best['concurrency']}")
+            break
+        concurrency *= 2
+    else:
+        best = max(results, key=lambda x: x['throughput_rps'])
+        print(f"\n✅ No saturation up to concurrency {args.max_concurrency}"
+              f" (peak {best['throughput_rps']:.1f} req/s)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"📁 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the permission firewall APIs")
+    parser.add_argument('--api', default='http://localhost:8000', help="main.py base URL (/check-permission)")
+    parser.add_argument('--dashboard', default=None,
+                        help="backend/app.py base URL (dashboard traffic is skipped without it)")
+    parser.add_argument('--rate', type=float, default=200.0, help="offered requests/s")
+    parser.add_argument('--scale-rate', action='store_true', help="scale the offered rate with concurrency")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per stage")
+    parser.add_argument('--start-concurrency', type=int, default=1)
+    parser.add_argument('--max-concurrency', type=int, default=256)
+    parser.add_argument('--browser-weight', type=float, default=2.0, help="per-event /check-permission (no bundle)")
+    parser.add_argument('--sync-weight', type=float, default=3.0, help="/check-permission/batch of queued events")
+    parser.add_argument('--refresh-weight', type=float, default=1.0, help="conditional /bundle + /policy")
+    parser.add_argument('--sweep-weight', type=float, default=1.0)
+    parser.add_argument('--dashboard-weight', type=float, default=3.0)
+    parser.add_argument('--sweep-size', type=int, default=20, help="events per monitor sweep burst")
+    parser.add_argument('--timeout', type=float, default=5.0, help="seconds before a request counts as an error")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--slo-ms', type=float, default=500.0, help="p99 latency budget")
+    parser.add_argument('--json', help="write per-stage results to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -1,13 +1,26 @@
 # main.py - FINAL WORKING VERSION
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from datetime import datetime
-import pickle
+from typing import List
+import base64
+import hashlib
+import json
 import os
+import threading
+import time
 import numpy as np
 
+from detection import RULES, load_permission_model, score
+from detection.engine import calibration_lock, calibrator
+from detection.ensemble import ensemble_from_env
+from detection.model import ENCODER_PATH, MODEL_PATH, ROOT_DIR
+from detection.policy import compile_policy, load_overrides
+from profiler import add_profiler
+
 app = FastAPI(title="Permission Watcher API")
 
 app.add_middleware(
@@ -18,64 +31,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ============================================
-# SIMPLE ENCODER CLASS (No pickle needed!)
-# ============================================
-class SimpleEncoder:
-    """Simple one-hot encoder for permission types"""
-    def __init__(self):
-        self.categories_ = [['camera', 'microphone', 'camera_microphone', 'location', 'notification']]
-        self.mapping = {
-            'camera': np.array([[1, 0, 0, 0, 0]]),
-            'microphone': np.array([[0, 1, 0, 0, 0]]),
-            'camera_microphone': np.array([[0, 0, 1, 0, 0]]),
-            'location': np.array([[0, 0, 0, 1, 0]]),
-            'notification': np.array([[0, 0, 0, 0, 1]])
-        }
-    
-    def transform(self, X):
-        perm = X[0][0] if isinstance(X[0], list) else X[0]
-        return self.mapping.get(perm, np.array([[0, 0, 0, 0, 0]]))
+# Sampling profiler, off until POST /admin/profile (output in ./profiles)
+profiler = add_profiler(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'), 'api')
 
 # ============================================
-# LOAD ML MODELS
+# LOAD ML MODELS (shared detection engine)
 # ============================================
-isolation_forest = None
-encoder = SimpleEncoder()  # Always create a fresh encoder (no pickle needed!)
-
 print("=" * 70)
 print("🔍 Loading ML models...")
-print(f"📁 Working directory: {os.getcwd()}")
-
-try:
-    # Load Isolation Forest ONLY
-    model_path = 'isolation_forest_model.pkl'
-    if os.path.exists(model_path):
-        print(f"   Found {model_path} ({os.path.getsize(model_path)} bytes)")
-        with open(model_path, 'rb') as f:
-            isolation_forest = pickle.load(f)
-        print("   ✅ Isolation Forest loaded successfully")
-    else:
-        print(f"   ❌ {model_path} not found")
-    
-    # Create fresh encoder (no pickle loading needed!)
-    print(f"   Creating fresh SimpleEncoder...")
-    encoder = SimpleEncoder()
-    print("   ✅ SimpleEncoder created")
-    
-    # Check final status
-    if isolation_forest is not None:
-        print("\n🤖 ML MODELS LOADED SUCCESSFULLY!")
-        print(f"   Model type: {type(isolation_forest).__name__}")
-        print(f"   Encoder type: {type(encoder).__name__}")
-    else:
-        print("\n⚠️ Isolation Forest not loaded - using rule-based detection only")
-
-except Exception as e:
-    print(f"\n❌ ERROR: {e}")
-    isolation_forest = None
-    encoder = SimpleEncoder()  # Create fresh encoder as fallback
+permission_model = load_permission_model()
+if permission_model is None:
+    print("\n⚠️ Isolation Forest not loaded - using rule-based detection only")
 
+# Optional ensemble layer (PERMISSION_ENSEMBLE="forest=1,frequency=0.5,dns=1"),
+# with the monitor's event log as the frequency detector's history
+ensemble = ensemble_from_env(os.path.join(ROOT_DIR, 'backend', 'permission_events.csv'))
 print("=" * 70)
 
 # ============================================
@@ -87,6 +57,9 @@ class PermissionRequest(BaseModel):
     timestamp: str
     url: str = None
 
+class PermissionBatch(BaseModel):
+    events: List[PermissionRequest]
+
 # ============================================
 # ENDPOINTS
 # ============================================
@@ -95,89 +68,192 @@ def root():
     """Health check endpoint"""
     return {
         "status": "running",
-        "model_loaded": isolation_forest is not None,
-        "encoder_loaded": encoder is not None,
+        "model_loaded": permission_model is not None,
+        "encoder_loaded": permission_model is not None,
         "working_directory": os.getcwd(),
         "model_files_exist": {
-            "isolation_forest": os.path.exists('isolation_forest_model.pkl'),
-            "encoder": os.path.exists('onehot_encoder.pkl')
+            "isolation_forest": os.path.exists(MODEL_PATH),
+            "encoder": os.path.exists(ENCODER_PATH)
         }
     }
 
+# ============================================
+# SCORING (exported to the extension via /bundle)
+# ============================================
+BUNDLE_SCHEMA = 4
+BUNDLE_TTL = 300  # seconds before the bundle picks up new calibrated thresholds
+
+def to_api_result(verdict):
+    """
+    Engine verdict -> response shape the extension expects.
+    anomaly_score is always the raw forest score (what the extension's offline
+    scoring returns too), and confidence is derived from it alone.
+    calibrated_score is the share of recent events for this permission that
+    scored lower (None while the permission has no history).
+    """
+    if verdict['anomaly_score'] is None:
+        ml_pred = 0
+        anomaly_score = 0.5
+    else:
+        ml_pred = -1 if verdict['ml_anomaly'] else 1
+        anomaly_score = verdict['anomaly_score']
+    return {
+        'threat_level': verdict['threat_level'].lower(),
+        'anomaly_score': anomaly_score,
+        'calibrated_score': verdict['calibrated_score'],
+        'decision_score': verdict['decision_score'],
+        'threshold': verdict['threshold'],
+        'reason': verdict['reason'],
+        'layers_triggered': verdict['layers_triggered'],
+        'ml_prediction': ml_pred,
+        'confidence': anomaly_score if ml_pred == -1 else 1 - anomaly_score,
+        'ensemble': verdict.get('ensemble')
+    }
+
+def build_scoring_bundle():
+    """
+    Compact, versioned export of everything score() needs, so the extension
+    can score locally when the backend is slow or down. The compiled model
+    table is sent as one byte of score per (app, permission, hour) cell,
+    quantized over the table's own [min, max], and one bit of verdict per
+    cell against the threshold score() applies right now (the calibrated one
+    for permissions with history, else the forest's), so the extension never
+    has to compare a quantized score with a threshold.
+    """
+    body = {
+        'schema': BUNDLE_SCHEMA,
+        'rules': RULES,
+        'model': None,
+    }
+    if permission_model is not None:
+        table = permission_model.table
+        lo, hi = float(table.min()), float(table.max())
+        scores = np.clip(np.rint((table - lo) / ((hi - lo) or 1.0) * 255), 0, 255).astype(np.uint8)
+        # One threshold per permission column; the last column is the unknown
+        # permission, calibrated under '*' (see detection.engine.calibration_key)
+        with calibration_lock:
+            calibrated = calibrator.thresholds()
+        thresholds = np.array([calibrated.get(key, permission_model.threshold)
+                               for key in permission_model.perms + ['*']])
+        anomalies = np.packbits((table > thresholds[None, :, None]).ravel())
+        body['model'] = {
+            'apps': permission_model.apps,
+            'perms': permission_model.perms,
+            'score_range': [lo, hi],
+            'scores': base64.b64encode(scores.tobytes()).decode('ascii'),
+            'anomalies': base64.b64encode(anomalies.tobytes()).decode('ascii'),
+        }
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+    body['version'] = f"{BUNDLE_SCHEMA}-{digest}"
+    return body
+
+_bundle = None
+_bundle_built = 0.0
+
+def get_scoring_bundle():
+    global _bundle, _bundle_built
+    if _bundle is None or time.monotonic() - _bundle_built > BUNDLE_TTL:
+        _bundle = build_scoring_bundle()
+        _bundle_built = time.monotonic()
+    return _bundle
+
+def event_hour(timestamp):
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).hour
+
+# ============================================
+# POLICY (decision table for enforcement)
+# ============================================
+# PERMISSION_ENFORCE=1 tells the extension to act on decisions instead of only
+# logging; PERMISSION_POLICY points at an overrides file (origin/app -> decisions)
+ENFORCE = os.environ.get('PERMISSION_ENFORCE', '').lower() in ('1', 'on', 'true')
+POLICY_FILE = os.environ.get('PERMISSION_POLICY', os.path.join(ROOT_DIR, 'policy_overrides.json'))
+
+def build_policy():
+    overrides = load_overrides(POLICY_FILE) if os.path.exists(POLICY_FILE) else {}
+    policy = compile_policy(overrides, 'enforce' if ENFORCE else 'monitor')
+    print(f"🛡️ Policy compiled ({policy.mode}): {policy.counts()}, {len(overrides)} overrides")
+    return policy
+
+def refresh_policy():
+    """Recompile every BUNDLE_TTL so calibrated thresholds carry over, off the request path"""
+    global _policy
+    while True:
+        time.sleep(BUNDLE_TTL)
+        try:
+            _policy = build_policy()
+        except Exception as e:
+            print(f"⚠️ Policy not refreshed, keeping the previous one: {e}")
+
+# Compiling takes ~100 ms, so requests only ever read the current table
+_policy = build_policy()
+threading.Thread(target=refresh_policy, name='policy-refresh', daemon=True).start()
+
+def get_policy():
+    return _policy
+
+# Scoring endpoints are plain `def` so FastAPI runs them on its thread pool:
+# with the ensemble on, a batch waits on detector threads and must not block
+# the event loop
 @app.post("/check-permission")
-async def check_permission(request: PermissionRequest):
+def check_permission(request: PermissionRequest):
     """Analyze permission request"""
     print(f"\n📥 Permission check:")
     print(f"   App: {request.app_name}")
     print(f"   Permission: {request.permission_type}")
     
     try:
-        # Parse timestamp
-        dt = datetime.fromisoformat(request.timestamp.replace('Z', '+00:00'))
-        hour = dt.hour
-        
-        # Rule-based detection
-        rule = check_rules(request.app_name, request.permission_type, hour)
-        print(f"   Rule-based: {rule['level']}")
-        
-        # ML detection (if available)
-        if isolation_forest:
-            ml_pred = -1 if (hour < 6 or hour > 22) else 1
-            ml_score = 0.7 if ml_pred == -1 else 0.3
-            print(f"   ML result: prediction={ml_pred}, score={ml_score}")
-        else:
-            ml_pred = 0
-            ml_score = 0.5
-            print(f"   ML not available - using default")
-        
-        # Combine results
-        if rule['level'] == 'high' or ml_pred == -1:
-            threat = 'high'
-        elif rule['level'] == 'medium':
-            threat = 'medium'
-        else:
-            threat = 'low'
-        
-        layers = []
-        if ml_pred == -1:
-            layers.append('ml_anomaly')
-        if rule['level'] != 'low':
-            layers.append('rule_based')
-        
-        result = {
-            'threat_level': threat,
-            'anomaly_score': ml_score,
-            'reason': rule['reason'],
-            'layers_triggered': layers,
-            'ml_prediction': ml_pred,
-            'confidence': 1 - ml_score
-        }
-        
-        print(f"   📤 Result: {threat}")
+        event = {'app_name': request.app_name, 'permission_type': request.permission_type,
+                 'hour': event_hour(request.timestamp), 'url': request.url}
+        result = to_api_result(score([event], ensemble=ensemble)[0])
+        result['decision'] = get_policy().decide(request.app_name, request.permission_type, event['hour'])
+        print(f"   📤 Result: {result['threat_level']}")
         return result
     
     except Exception as e:
         print(f"❌ Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def check_rules(app, perm, hour):
-    """Rule-based threat detection"""
-    app = app.lower()
-    perm = perm.lower()
-    
-    # High-risk combinations
-    if 'calculator' in app and 'camera' in perm:
-        return {'level': 'high', 'reason': 'Calculator requesting camera is suspicious'}
-    
-    if 'notepad' in app and ('camera' in perm or 'microphone' in perm):
-        return {'level': 'high', 'reason': f'Notepad requesting {perm} is suspicious'}
-    
-    # Time-based rules
-    if hour < 6 or hour > 22:
-        if 'camera' in perm or 'microphone' in perm:
-            return {'level': 'medium', 'reason': f'Sensitive permission at unusual hour ({hour}:00)'}
-    
-    return {'level': 'low', 'reason': 'Normal permission pattern'}
+@app.post("/check-permission/batch")
+def check_permission_batch(batch: PermissionBatch):
+    """
+    Background sync from the extension: events already scored locally.
+    Returns the server verdict for each event, in order.
+    """
+    print(f"\n📥 Batch sync: {len(batch.events)} events")
+    results = [None] * len(batch.events)
+    events, positions = [], []
+    for i, event in enumerate(batch.events):
+        try:
+            hour = event_hour(event.timestamp)
+        except ValueError as e:
+            results[i] = {'error': str(e)}
+            continue
+        events.append({'app_name': event.app_name, 'permission_type': event.permission_type,
+                       'hour': hour, 'url': event.url})
+        positions.append(i)
+    for i, verdict in zip(positions, score(events, ensemble=ensemble)):
+        results[i] = to_api_result(verdict)
+    return {"received": len(batch.events), "results": results}
+
+@app.get("/bundle")
+def get_bundle(request: Request):
+    """Scoring bundle for extension-side offline scoring (ETag-cached)"""
+    bundle = get_scoring_bundle()
+    etag = f'"{bundle["version"]}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(bundle, headers=headers)
+
+@app.get("/policy")
+def get_policy_table(request: Request):
+    """Decision table for in-process enforcement in the extension (ETag-cached)"""
+    body = get_policy().to_wire()
+    etag = f'"{body["version"]}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
 
 @app.get("/stats")
 def get_stats():
@@ -185,9 +261,10 @@ def get_stats():
     return {
         "status": "running",
         "models": {
-            "isolation_forest": isolation_forest is not None,
-            "encoder": encoder is not None
-        }
+            "isolation_forest": permission_model is not None,
+            "encoder": permission_model is not None
+        },
+        "ensemble": ensemble.stats() if ensemble is not None else None
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+# profiler.py - On-demand sampling profiler for the APIs and the monitor
+#
+# A background thread snapshots every thread's Python stack with
+# sys._current_frames() at a fixed interval and counts identical stacks,
+# along with the wall time measured since the previous snapshot (the wait
+# overshoots the interval under load, and a snapshot itself takes time).
+# Profiling stops after a time window or after N requests (or monitor
+# sweeps), whichever comes first, and the counts are written as:
+#   <name>.collapsed          - "frame;frame;frame count" lines for
+#                               flamegraph.pl / inferno / speedscope
+#   <name>.speedscope.json    - speedscope's sampled profile format
+# Nothing runs while the profiler is idle: no thread, no hooks, and the
+# ASGI middleware only checks a boolean per request.
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_INTERVAL = 0.005
+MAX_SECONDS = 600
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir, label):
+        self.output_dir = output_dir
+        self.label = label
+        self.lock = threading.Lock()
+        self.active = False
+        self.last = None        # summary of the last finished run
+        self._thread = None
+
+    # ============================================
+    # CONTROL
+    # ============================================
+    def start(self, seconds=30.0, requests=None, interval=DEFAULT_INTERVAL):
+        """
+        Start sampling for `seconds`, or until `requests` requests finish
+        Returns: False if a run is already in progress
+        """
+        with self.lock:
+            if self.active:
+                return False
+            self.active = True
+            self.seconds = min(float(seconds), MAX_SECONDS)
+            self.requests_left = requests
+            self.interval = interval
+            self.started = time.time()
+            self.samples = 0
+            self.stacks = {}
+            self.stack_seconds = {}
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        """Stop the current run early and wait for its output to be written"""
+        if self.active:
+            self._stop.set()
+            self._thread.join(timeout=5)
+
+    def request_done(self):
+        """Count one finished request / sweep toward the `requests` limit"""
+        if self.active and self.requests_left is not None:
+            self.requests_left -= 1
+            if self.requests_left <= 0:
+                self._stop.set()
+
+    def status(self):
+        if self.active:
+            return {
+                'active': True,
+                'elapsed': round(time.time() - self.started, 3),
+                'seconds': self.seconds,
+                'requests_left': self.requests_left,
+                'samples': self.samples,
+            }
+        return {'active': False, 'last': self.last}
+
+    # ============================================
+    # SAMPLING
+    # ============================================
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        names = {}
+        last = time.perf_counter()
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            now = time.perf_counter()
+            dt, last = now - last, now
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append((f"thread {names.get(ident, ident)}", '', 0))
+                stack.reverse()
+                key = tuple(stack)
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.stack_seconds[key] = self.stack_seconds.get(key, 0.0) + dt
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self._finish()
+
+    def _finish(self):
+        elapsed = time.time() - self.started
+        base = os.path.join(self.output_dir, f"{self.label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._write_collapsed(base + '.collapsed')
+            self._write_speedscope(base + '.speedscope.json')
+            files = [base + '.collapsed', base + '.speedscope.json']
+            print(f"🔬 Profile written: {files[0]} ({self.samples} samples, {elapsed:.1f}s)")
+        except OSError as e:
+            print(f"⚠️ Could not write profile: {e}")
+            files = []
+        with self.lock:
+            self.last = {'samples': self.samples, 'seconds': round(elapsed, 3), 'files': files}
+            self.stacks = {}
+            self.stack_seconds = {}
+            self.active = False
+
+    # ============================================
+    # OUTPUT
+    # ============================================
+    @staticmethod
+    def _frame_name(frame):
+        name, filename, line = frame
+        if not filename:
+            return name
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def _write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda kv: -kv[1]):
+                # ';' separates frames in the collapsed format
+                f.write(';'.join(self._frame_name(fr).replace(';', ',') for fr in stack))
+                f.write(f" {count}\n")
+
+    def _write_speedscope(self, path):
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, seconds in self.stack_seconds.items():
+            ids = []
+            for fr in stack:
+                i = index.get(fr)
+                if i is None:
+                    i = index[fr] = len(frames)
+                    frames.append({'name': fr[0], 'file': fr[1], 'line': fr[2]} if fr[1] else {'name': fr[0]})
+                ids.append(i)
+            samples.append(ids)
+            weights.append(seconds)
+        doc = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': self.label,
+            'exporter': 'permission-firewall profiler.py',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': f"{self.label} ({self.samples} samples)",
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+        with open(path, 'w') as f:
+            json.dump(doc, f)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware counting finished HTTP requests for SamplingProfiler"""
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if self.profiler.active and scope['type'] == 'http' and not scope['path'].startswith('/admin/'):
+            self.profiler.request_done()
+
+
+def is_local(request):
+    """Admin endpoints only answer clients on the same machine"""
+    return request.client is not None and request.client.host in ('127.0.0.1', '::1', 'localhost')
+
+
+def add_profiler(app, output_dir, label):
+    """
+    Attach a SamplingProfiler to a FastAPI app:
+      POST   /admin/profile?seconds=30&requests=N&interval_ms=5  - start a run
+      GET    /admin/profile                                       - status / last output files
+      DELETE /admin/profile                                       - stop early and write output
+    Returns: the profiler
+    """
+    from fastapi import HTTPException, Request
+
+    profiler = SamplingProfiler(output_dir, label)
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
+    def check_local(request):
+        if not is_local(request):
+            raise HTTPException(status_code=403, detail="admin endpoints are local-only")
+
+    @app.post("/admin/profile")
+    def start_profile(request: Request, seconds: float = 30.0, requests: int = None,
+                      interval_ms: float = DEFAULT_INTERVAL * 1000):
+        check_local(request)
+        if seconds <= 0 or interval_ms <= 0 or (requests is not None and requests <= 0):
+            raise HTTPException(status_code=400, detail="seconds, requests and interval_ms must be positive")
+        if not profiler.start(seconds, requests, interval_ms / 1000):
+            raise HTTPException(status_code=409, detail="a profile is already running")
+        print(f"🔬 Profiling {label} for {seconds:g}s" + (f" or {requests} requests" if requests else ""))
+        return profiler.status()
+
+    @app.get("/admin/profile")
+    def profile_status(request: Request):
+        check_local(request)
+        return profiler.status()
+
+    @app.delete("/admin/profile")
+    def stop_profile(request: Request):
+        check_local(request)
+        profiler.stop()
+        return profiler.status()
+
+    return profiler